@@ -1,10 +1,2463 @@
 import tkinter as tk
 from tkinter import ttk, simpledialog, messagebox
+import tkinter.font as tkfont
 import os
 import datetime
+import errno
 import shutil
 import re
+import ctypes.util
 import subprocess
+import sys
+import bisect
+import codecs
+import collections
+import hashlib
+import heapq
+import mmap
+import queue
+import struct
+import tempfile
+import threading
+import time
+import concurrent.futures
+import fnmatch
+import functools
+import itertools
+import math
+import multiprocessing
+from array import array
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Files at least this large open in the memory-mapped read-only viewer
+PAGED_VIEW_THRESHOLD = 64 * 1024 * 1024
+# Lines kept loaded above and below the viewport in the paged viewer
+PAGED_VIEW_MARGIN = 200
+# Files at least this large are read on a background thread
+STREAM_LOAD_THRESHOLD = 1024 * 1024
+# Time the main loop spends inserting streamed chunks per batch
+STREAM_BATCH_SECONDS = 0.02
+# Quiet time after the last keystroke before query suggestions refresh
+SUGGESTION_DEBOUNCE_MS = 80
+# Fuzzy query suggestions: rows shown, names tried per slice and the time a
+# slice may take before yielding to Tk
+FUZZY_TOP_K = 10
+FUZZY_BATCH = 512
+FUZZY_FRAME_SECONDS = 0.008
+# fzf-style scores: every matched character, the gap before it, and bonuses
+# for starting a word, a camelCase hump, following the previous match and
+# matching case exactly; the first character's bonus counts double
+FUZZY_SCORE_MATCH = 16
+FUZZY_GAP_START = 3
+FUZZY_GAP_EXTENSION = 1
+FUZZY_BONUS_BOUNDARY = 8
+FUZZY_BONUS_CAMEL = 7
+FUZZY_BONUS_CONSECUTIVE = 4
+FUZZY_BONUS_CASE = 1
+# Limits for the workspace completion index built from files under current_dir
+WORKSPACE_MAX_FILES = 50000
+WORKSPACE_MAX_FILE_SIZE = 1024 * 1024
+WORKSPACE_BATCH_FILES = 200
+# Quiet time after a directory change before the workspace index is rebuilt
+WORKSPACE_REFRESH_MS = 5000
+# With inotify, at most this many directories under the index are watched
+WORKSPACE_MAX_WATCHES = 1024
+# Ctrl+N cycles through at most this many of the best ranked completions
+COMPLETION_TOP_K = 30
+# Lines above and below the cursor searched for nearby uses of a candidate
+COMPLETION_NEARBY_LINES = 100
+# Accepted completions remembered across tabs for ranking
+ACCEPTED_LRU_SIZE = 500
+# Find in files (:grep)
+GREP_BATCH_FILES = 64
+GREP_CHUNK_BYTES = 4 * 1024 * 1024
+GREP_MAX_RESULTS = 10000
+GREP_PREVIEW_CHARS = 200
+# Persistent trigram indexes that narrow :grep, one file per indexed root
+INDEX_DIR = os.path.join(os.path.expanduser('~'), '.tex_nav', 'index')
+TRIGRAM_BATCH_FILES = 64
+# Text files larger than this are not indexed and are always grepped
+TRIGRAM_MAX_FILE_SIZE = 16 * 1024 * 1024
+# Limits for the :o file list, and how old a crawl may get before the next
+# :o refreshes it in the background
+FILE_LIST_MAX_FILES = 500000
+FILE_LIST_REFRESH_SECONDS = 60
+# Ignore files read by the :o crawler, and directories it always skips
+FILE_LIST_IGNORE_FILES = ('.gitignore', '.ignore')
+FILE_LIST_IGNORE = ('node_modules', '__pycache__')
+# Copy, move and delete jobs: worker threads, jobs doing I/O on one device
+# at a time, bytes per read while copying, and the jobs panel refresh rate
+JOB_WORKERS = 8
+JOB_IO_LIMIT = 2
+JOB_CHUNK_BYTES = 1024 * 1024
+JOB_POLL_MS = 200
+# Directory copies: threads per copy, files handed to a thread at a time
+# (fewer if they add up to COPY_BATCH_BYTES), and bytes per kernel copy call
+COPY_WORKERS = 8
+COPY_BATCH_FILES = 32
+COPY_BATCH_BYTES = 16 * 1024 * 1024
+COPY_RANGE_BYTES = 8 * 1024 * 1024
+# ioctl that makes dst share src's blocks on Btrfs, XFS and other
+# reflink-capable filesystems (see <linux/fs.h>)
+FICLONE = 0x40049409
+# Errors meaning a fast copy path is not available here, before any data moved
+COPY_FALLBACK_ERRNOS = {getattr(errno, name) for name in ('ENOSYS', 'EXDEV', 'EINVAL', 'EBADF', 'ENOTSUP',
+                                                           'EOPNOTSUPP', 'ENOTSOCK', 'ETXTBSY', 'EPERM')
+                        if hasattr(errno, name)}
+# A directory whose mtime is this close to the time it was listed may still
+# change within the same mtime tick, so its listing is not reused
+DIR_MTIME_SLACK_NS = 2 * 1000 * 1000 * 1000
+# Directory listings kept by DirectoryCache; the least recently used go first
+DIR_CACHE_SIZE = 256
+# Lines above and below the viewport that get search highlights while typing
+SEARCH_VIEW_MARGIN = 100
+# How often watched directories and open files are checked when inotify is
+# not available
+WATCH_POLL_MS = 1000
+# Buffer size for draining pending inotify events
+WATCH_READ_BYTES = 64 * 1024
+# inotify event flags (see <sys/inotify.h>)
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ONLYDIR = 0x1000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+# struct inotify_event header: wd, mask, cookie, len; the name follows
+INOTIFY_EVENT = struct.Struct('iIII')
+# Bytes read from the start of a file to classify it before loading
+SNIFF_BYTES = 8192
+# Encodings whose newlines are single '\n' bytes, so the paged viewer can index them
+PAGED_ENCODINGS = ('utf-8', 'utf-8-sig', 'latin-1')
+
+BOMS = (
+    (codecs.BOM_UTF32_LE, 'utf-32'),  # Checked before UTF-16, whose LE BOM is a prefix
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+# Control bytes that still show up in ordinary text files
+TEXT_CONTROL_BYTES = b'\t\n\r\f\b\x1b'
+
+def sniff_file(path):
+    # Classify a file from its first few KB; returns ('text', encoding) or ('binary', None)
+    with open(path, 'rb') as file:
+        head = file.read(SNIFF_BYTES)
+    for bom, encoding in BOMS:
+        if head.startswith(bom):
+            return 'text', encoding
+    if b'\0' in head:
+        return 'binary', None
+    control = sum(1 for byte in head if byte < 32 and byte not in TEXT_CONTROL_BYTES)
+    if head and control / len(head) > 0.1:
+        return 'binary', None
+    try:
+        # The sample may end in the middle of a multi-byte character
+        codecs.getincrementaldecoder('utf-8')().decode(head, final=False)
+        return 'text', 'utf-8'
+    except UnicodeDecodeError:
+        return 'text', 'latin-1'
+
+class PieceTable:
+    # Sources larger than this get a cached newline table for line lookups
+    LINE_TABLE_MIN = 64 * 1024
+    # Typed text is appended to the previous added piece up to this size
+    COALESCE_MAX = 1024
+
+    def __init__(self, text=''):
+        self.version = 0
+        self.reset(text)
+
+    def reset(self, text=''):
+        # Each piece is (source, start, length, newlines)
+        self.pieces = [(text, 0, len(text), text.count('\n'))] if text else []
+        self.length = len(text)
+        self.newlines = self.pieces[0][3] if self.pieces else 0
+        self.original = text
+        self._line_tables = {}
+        self._snapshot = text
+        self.version += 1
+
+    def __len__(self):
+        return self.length
+
+    def line_count(self):
+        return self.newlines + 1
+
+    def _changed(self):
+        self._snapshot = None
+        self.version += 1
+
+    def _split(self, piece, rel):
+        source, start, length, newlines = piece
+        # Count newlines on the shorter side of the split
+        if rel <= length // 2:
+            left_newlines = source.count('\n', start, start + rel)
+        else:
+            left_newlines = newlines - source.count('\n', start + rel, start + length)
+        return ((source, start, rel, left_newlines),
+                (source, start + rel, length - rel, newlines - left_newlines))
+
+    def insert(self, offset, text):
+        if not text:
+            return
+        offset = max(0, min(offset, self.length))
+        newlines = text.count('\n')
+        new_piece = (text, 0, len(text), newlines)
+        pos = 0
+        for i, piece in enumerate(self.pieces):
+            source, start, length, piece_newlines = piece
+            rel = offset - pos
+            if rel <= length:
+                if rel == length:
+                    if (source is not self.original and start + length == len(source)
+                            and len(source) < self.COALESCE_MAX):
+                        # Extend the previous insert instead of adding a piece
+                        source += text
+                        self.pieces[i] = (source, start, length + len(text), piece_newlines + newlines)
+                    else:
+                        self.pieces.insert(i + 1, new_piece)
+                elif rel == 0:
+                    self.pieces.insert(i, new_piece)
+                else:
+                    left, right = self._split(piece, rel)
+                    self.pieces[i:i + 1] = [left, new_piece, right]
+                break
+            pos += length
+        else:
+            self.pieces.append(new_piece)
+        self.length += len(text)
+        self.newlines += newlines
+        self._changed()
+
+    def delete(self, start, end):
+        start = max(0, start)
+        end = min(end, self.length)
+        if start >= end:
+            return
+        pieces = []
+        pos = 0
+        for piece in self.pieces:
+            piece_end = pos + piece[2]
+            if piece_end <= start or pos >= end:
+                pieces.append(piece)
+            else:
+                rest, rest_pos = piece, pos
+                if pos < start:
+                    left, rest = self._split(piece, start - pos)
+                    pieces.append(left)
+                    rest_pos = start
+                if piece_end > end:
+                    pieces.append(self._split(rest, end - rest_pos)[1])
+            pos = piece_end
+        self.pieces = pieces
+        self.length -= end - start
+        self.newlines = sum(piece[3] for piece in pieces)
+        self._changed()
+
+    def _line_table(self, source):
+        entry = self._line_tables.get(id(source))
+        if entry is None or entry[0] is not source:
+            table = array('q', (m.start() for m in re.finditer('\n', source)))
+            entry = self._line_tables[id(source)] = (source, table)
+        return entry[1]
+
+    def offset_of(self, line, col=0):
+        # line is 1-based and col 0-based, like a tk.Text index
+        if line <= 1:
+            return min(max(col, 0), self.length)
+        remaining = line - 1
+        pos = 0
+        for source, start, length, newlines in self.pieces:
+            if remaining <= newlines:
+                if len(source) >= self.LINE_TABLE_MIN:
+                    table = self._line_table(source)
+                    index = table[bisect.bisect_left(table, start) + remaining - 1]
+                else:
+                    index = start - 1
+                    for _ in range(remaining):
+                        index = source.find('\n', index + 1)
+                return min(pos + index - start + 1 + max(col, 0), self.length)
+            remaining -= newlines
+            pos += length
+        return self.length
+
+    def get_text(self, start=0, end=None):
+        if end is None or end > self.length:
+            end = self.length
+        if start <= 0 and end == self.length:
+            return self.getvalue()
+        parts = []
+        pos = 0
+        for source, piece_start, length, _ in self.pieces:
+            if pos >= end:
+                break
+            if pos + length > start:
+                a = max(start - pos, 0)
+                b = min(end - pos, length)
+                parts.append(source[piece_start + a:piece_start + b])
+            pos += length
+        return ''.join(parts)
+
+    def line_of(self, offset):
+        # 1-based line containing an offset
+        line = 1
+        pos = 0
+        for source, start, length, newlines in self.pieces:
+            if offset < pos + length:
+                rel = offset - pos
+                if len(source) >= self.LINE_TABLE_MIN:
+                    table = self._line_table(source)
+                    line += bisect.bisect_left(table, start + rel) - bisect.bisect_left(table, start)
+                else:
+                    line += source.count('\n', start, start + rel)
+                return line
+            line += newlines
+            pos += length
+        return line
+
+    def get_lines(self, first, last):
+        start = self.offset_of(first)
+        if last >= self.line_count():
+            return self.get_text(start)
+        return self.get_text(start, self.offset_of(last + 1) - 1)
+
+    def get_line(self, line):
+        return self.get_lines(line, line)
+
+    def getvalue(self):
+        # The joined text is cached until the next edit
+        if self._snapshot is None:
+            self._snapshot = ''.join(source[start:start + length]
+                                     for source, start, length, _ in self.pieces)
+        return self._snapshot
+
+    def snapshot(self):
+        # Pieces are immutable, so a copy of the list freezes the current text
+        frozen = PieceTable()
+        frozen.pieces = list(self.pieces)
+        frozen.length = self.length
+        frozen.newlines = self.newlines
+        frozen._snapshot = self._snapshot
+        frozen.version = self.version
+        return frozen
+
+    def iter_chunks(self, size=1 << 20):
+        if self._snapshot is not None:
+            for i in range(0, len(self._snapshot), size):
+                yield self._snapshot[i:i + size]
+            return
+        for source, start, length, _ in self.pieces:
+            for i in range(start, start + length, size):
+                yield source[i:min(i + size, start + length)]
+
+# Permission bits for newly created files, applied to atomic saves
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+def atomic_write(path, chunks, encoding=None, binary=False):
+    # Write to a temp file in the same directory, fsync it and rename it over
+    # the original, so a crash never leaves a half-written file behind.
+    # Symlinks are followed, so the link survives and its target is written
+    path = os.path.realpath(path)
+    directory = os.path.dirname(path)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with (os.fdopen(fd, 'wb') if binary else os.fdopen(fd, 'w', encoding=encoding)) as file:
+            for chunk in chunks:
+                file.write(chunk)
+            file.flush()
+            os.fsync(file.fileno())
+        try:
+            linked = os.stat(path).st_nlink > 1
+            shutil.copymode(path, temp_path)
+        except FileNotFoundError:
+            linked = False
+            os.chmod(temp_path, 0o666 & ~UMASK)
+        if linked:
+            # Renaming would split the file off from its other hard links;
+            # with the new text safely on disk, copy it into the file instead
+            with open(temp_path, 'rb') as source, open(path, 'r+b') as target:
+                shutil.copyfileobj(source, target)
+                target.truncate()
+                target.flush()
+                os.fsync(target.fileno())
+            os.remove(temp_path)
+            return
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    if hasattr(os, 'O_DIRECTORY'):
+        # Persist the rename itself where the platform allows it
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+class PagedFile:
+    # Bytes scanned per step while building the newline index
+    INDEX_CHUNK = 4 * 1024 * 1024
+    NEWLINE = re.compile(b'\n')
+
+    def __init__(self, path, encoding='utf-8'):
+        self.path = path
+        self.encoding = encoding
+        self.file = open(path, 'rb')
+        self.size = os.fstat(self.file.fileno()).st_size
+        # The file is mapped read-only; find and line counting run on the
+        # mapped bytes without copying them into a str
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+        self.offsets = array('q', [0])  # Byte offset where each line starts
+        self.indexed = 0
+        self.complete = self.size == 0
+        self.indexing = False
+        self.cancelled = False
+        self.lock = threading.Lock()
+
+    def build_index(self):
+        # Runs on a background thread; readers only see whole chunks
+        with self.lock:
+            if self.cancelled or self.map is None:
+                return
+            self.indexing = True
+        pos = 0
+        while pos < self.size and not self.cancelled:
+            end = min(pos + self.INDEX_CHUNK, self.size)
+            starts = array('q', (m.end() for m in self.NEWLINE.finditer(self.map, pos, end)))
+            with self.lock:
+                self.offsets.extend(starts)
+                self.indexed = pos = end
+        with self.lock:
+            self.indexing = False
+            self.complete = not self.cancelled
+            if self.cancelled:
+                self._close_map()
+
+    def _close_map(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
+
+    def close(self):
+        with self.lock:
+            self.cancelled = True
+            # An indexing thread closes the map itself once it stops
+            if not self.indexing:
+                self._close_map()
+
+    def line_count(self):
+        with self.lock:
+            return len(self.offsets)
+
+    def estimated_line_count(self):
+        with self.lock:
+            if self.complete or not self.indexed:
+                return len(self.offsets)
+            return max(len(self.offsets), int(len(self.offsets) * self.size / self.indexed))
+
+    def read_bytes(self, start, length):
+        if self.map is None:
+            return b''
+        return self.map[start:start + length]
+
+    def decode(self, data):
+        return data.decode(self.encoding, 'replace').replace('\r\n', '\n')
+
+    def line_of(self, pos):
+        with self.lock:
+            if pos < self.indexed or self.complete:
+                return bisect.bisect_right(self.offsets, pos) - 1
+            line, base = len(self.offsets) - 1, self.offsets[-1]
+        # Past the indexed region, count the remaining newlines on the map
+        return line + sum(1 for _ in self.NEWLINE.finditer(self.map, base, pos))
+
+    def read_lines(self, first, count):
+        with self.lock:
+            total = len(self.offsets)
+            first = max(0, min(first, total - 1))
+            start = self.offsets[first]
+            last = first + count
+            if last < total:
+                end = self.offsets[last]
+            elif self.complete:
+                end = self.size
+            else:
+                end = None
+        if end is None:
+            # The index has not reached these lines yet, so find their end on the map
+            end = start
+            for _ in range(count):
+                end = self.map.find(b'\n', end) + 1
+                if end == 0:
+                    end = self.size
+                    break
+        data = self.read_bytes(start, end - start)
+        text = self.decode(data)
+        # A window ending before EOF carries the newline of its last line
+        if end < self.size and text.endswith('\n'):
+            text = text[:-1]
+        return first, text
+
+    def line_start(self, line):
+        with self.lock:
+            return self.offsets[max(0, min(line, len(self.offsets) - 1))]
+
+    def find(self, pattern, pos=0):
+        # Search from a byte offset; returns (line, line_start, start, end)
+        if self.map is None:
+            return None
+        match = pattern.search(self.map, pos)
+        if match is None:
+            return None
+        line = self.line_of(match.start())
+        return line, self.line_start_of(line, match.start()), match.start(), match.end()
+
+    def line_start_of(self, line, pos):
+        with self.lock:
+            if line < len(self.offsets):
+                return self.offsets[line]
+        return self.map.rfind(b'\n', 0, pos) + 1
+
+    def match_span(self, line_start, start, end):
+        # Character column and length of a byte match within its line
+        return (len(self.decode(self.read_bytes(line_start, start - line_start))),
+                len(self.decode(self.read_bytes(start, end - start))))
+
+class HexFile(PagedFile):
+    # Binary files are shown as a hex dump with a fixed number of bytes per
+    # line, so line offsets are computed instead of indexed
+    WIDTH = 16
+
+    def __init__(self, path):
+        super().__init__(path, 'latin-1')
+        self.complete = True
+
+    def build_index(self):
+        pass
+
+    def line_count(self):
+        return max(1, -(-self.size // self.WIDTH))
+
+    def estimated_line_count(self):
+        return self.line_count()
+
+    def line_start(self, line):
+        return max(0, min(line, self.line_count() - 1)) * self.WIDTH
+
+    def line_of(self, pos):
+        return pos // self.WIDTH
+
+    def line_start_of(self, line, pos):
+        return line * self.WIDTH
+
+    def read_lines(self, first, count):
+        first = max(0, min(first, self.line_count() - 1))
+        data = self.read_bytes(first * self.WIDTH, count * self.WIDTH)
+        rows = []
+        for i in range(0, len(data), self.WIDTH):
+            row = data[i:i + self.WIDTH]
+            printable = ''.join(chr(byte) if 32 <= byte < 127 else '.' for byte in row)
+            rows.append(f"{first * self.WIDTH + i:08x}  {row.hex(' '):<{self.WIDTH * 3 - 1}}  {printable}")
+        return first, '\n'.join(rows)
+
+    def match_span(self, line_start, start, end):
+        # Point at the hex digits, clipped to the line the match starts on
+        end = min(end, line_start + self.WIDTH)
+        return 10 + (start - line_start) * 3, max((end - start) * 3 - 1, 1)
+
+class FileLoader:
+    CHUNK = 256 * 1024
+    # Queued when the text turns out not to be in the sniffed encoding; the
+    # widget is cleared and the file streams in again as Latin-1
+    RESTART = object()
+
+    def __init__(self, path, encoding=None):
+        self.path = path
+        self.encoding = encoding
+        self.size = os.path.getsize(path)
+        # Bounded so a slow main loop holds back the reader instead of
+        # buffering the whole file in the queue
+        self.queue = queue.Queue(maxsize=16)
+        self.position = 0
+        self.error = None
+        self.cancelled = False
+
+    def run(self):
+        try:
+            try:
+                self.read()
+            except UnicodeDecodeError:
+                if self.encoding == 'latin-1':
+                    raise
+                self.encoding = 'latin-1'
+                self._put(self.RESTART)
+                self.read()
+        except Exception as e:
+            self.error = e
+        self._put(None)
+
+    def read(self):
+        with open(self.path, 'r', encoding=self.encoding) as file:
+            while not self.cancelled:
+                chunk = file.read(self.CHUNK)
+                if not chunk:
+                    break
+                self.position = file.buffer.tell()
+                self._put(chunk)
+
+    def _put(self, item):
+        while not self.cancelled:
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def cancel(self):
+        self.cancelled = True
+
+    def progress(self):
+        return min(100, int(self.position * 100 / self.size)) if self.size else 100
+
+@functools.lru_cache(maxsize=64)
+def compile_search(term, nocase=False, regex=False, whole_word=False, multiline=False):
+    # Cached so repeated Find Next and Replace calls never recompile.
+    # ^ and $ always anchor at lines; multiline lets . match line breaks and,
+    # in plain searches, \n stand for one
+    if not regex:
+        term = re.escape(term)
+        if multiline:
+            term = term.replace('\\\\n', '\\n')
+    if whole_word:
+        term = rf'(?<!\w)(?:{term})(?!\w)'
+    flags = re.MULTILINE
+    if multiline:
+        flags |= re.DOTALL
+    if nocase:
+        flags |= re.IGNORECASE
+    return re.compile(term, flags)
+
+@functools.lru_cache(maxsize=16)
+def compile_bytes_search(pattern, encoding):
+    # The paged viewer and :grep search the raw file bytes. ASCII is regex
+    # syntax and is kept as is; every other character becomes its escaped
+    # bytes, grouped so a quantifier after it repeats the whole character.
+    # Raises ValueError when a character has no bytes in this encoding
+    parts = []
+    in_class = False
+    escaped = False
+    for char in pattern.pattern:
+        if ord(char) < 128:
+            if not escaped:
+                if char == '[':
+                    in_class = True
+                elif char == ']':
+                    in_class = False
+            escaped = char == '\\' and not escaped
+            parts.append(char.encode('ascii'))
+            continue
+        if escaped:
+            # Any escaped non-ASCII character is a literal; its bytes are
+            # escaped below, so the backslash is dropped
+            parts.pop()
+            escaped = False
+        try:
+            data = char.encode(encoding)
+        except UnicodeEncodeError:
+            raise ValueError(f"'{char}' cannot be represented in {encoding}")
+        if len(data) == 1:
+            parts.append(re.escape(data))
+        elif in_class:
+            raise ValueError(f"'{char}' takes several bytes in {encoding} and cannot be used in a character class")
+        else:
+            parts.append(b'(?:' + re.escape(data) + b')')
+    return re.compile(b''.join(parts), pattern.flags & ~re.UNICODE)
+
+# Tcl 8.6 counts a character outside the BMP (an emoji, for example) as two
+# index characters, so Tk columns and code point columns differ on its lines
+ASTRAL = re.compile('[\U00010000-\U0010ffff]') if tk.TclVersion < 9 else None
+
+def line_start_table(text):
+    # Offset of the first character of each line
+    table = array('q', [0])
+    table.extend(match.end() for match in re.finditer('\n', text))
+    return table
+
+def tk_indices(line_starts, offsets, text=None):
+    # Convert non-decreasing character offsets to line.col indices in one
+    # forward sweep over the line table. Given the text, columns count the
+    # characters outside the BMP twice, as Tcl 8.6 does
+    astral = ASTRAL if text is not None and ASTRAL is not None and ASTRAL.search(text) else None
+    lines = len(line_starts)
+    indices = []
+    line = bisect.bisect_right(line_starts, offsets[0]) if offsets else 1
+    # Characters outside the BMP on the current line before pos
+    pos = extra = 0
+    for offset in offsets:
+        while line < lines and line_starts[line] <= offset:
+            line += 1
+        start = line_starts[line - 1]
+        col = offset - start
+        if astral is not None:
+            if pos < start:
+                pos, extra = start, 0
+            extra += len(astral.findall(text, pos, offset))
+            pos = offset
+            col += extra
+        indices.append(f"{line}.{col}")
+    return indices
+
+# Applies a flat start/end/text list of replacements, last range first, as
+# a single undo step and without a round trip to Python per range
+TCL_REPLACE_RANGES = """
+proc texnav_replace_ranges {widget edits} {
+    set auto [$widget cget -autoseparators]
+    $widget configure -autoseparators 0
+    $widget edit separator
+    foreach {start end text} $edits {
+        $widget replace $start $end $text
+    }
+    $widget edit separator
+    $widget configure -autoseparators $auto
+}
+"""
+
+class SearchIndex:
+    # Every match of a compiled pattern in one version of a buffer, found in
+    # a single re pass. Offsets are characters into the buffer text; Find Next
+    # bisects the sorted starts instead of searching the widget again
+    SCAN_BATCH = 1024
+    # A pattern whose matches are all shorter than SCAN_OVERLAP and which
+    # never looks ahead is searched in fixed-size overlapping windows, so a
+    # rare term cannot hold the UI past the deadline. A window decides nothing
+    # about a match that could reach its edge; the next window starts before it
+    SCAN_WINDOW = 1 << 16
+    SCAN_OVERLAP = 1 << 12
+    NEWLINE = re.compile('\n')
+
+    def __init__(self, buffer, pattern):
+        self.buffer = buffer
+        self.version = buffer.version
+        self.pattern = pattern
+        self._text = buffer.getvalue()
+        self.starts = array('q')
+        self.ends = array('q')
+        # Offset of the first character of each line
+        self.line_starts = array('q', [0])
+        # The pass runs lazily so it can be spread over several idle slices
+        self._line_pos = 0
+        if self.windowed(pattern):
+            self._pos = 0
+            self._matches = None
+        else:
+            # Any other pattern could match differently on part of the text,
+            # so it gets a single pass over all of it
+            self._pos = None
+            self._matches = pattern.finditer(self._text)
+
+    @classmethod
+    def windowed(cls, pattern):
+        if '(?=' in pattern.pattern or '(?!' in pattern.pattern:
+            return False
+        return sre_parse.parse(pattern.pattern, pattern.flags).getwidth()[1] < cls.SCAN_OVERLAP
+
+    def scan(self, deadline=None):
+        # Carry the pass on until the deadline; returns True once it is complete.
+        # The line table is finished first so matches found so far can be placed
+        text = self._text
+        while self._line_pos is not None:
+            end = min(self._line_pos + self.SCAN_WINDOW, len(text))
+            self.line_starts.extend(match.end() for match in self.NEWLINE.finditer(text, self._line_pos, end))
+            self._line_pos = end if end < len(text) else None
+            if self._line_pos is not None and deadline is not None and time.monotonic() >= deadline:
+                return False
+        while self._matches is not None:
+            count = 0
+            for match in itertools.islice(self._matches, self.SCAN_BATCH):
+                count += 1
+                if match.end() > match.start():
+                    self.starts.append(match.start())
+                    self.ends.append(match.end())
+            if count < self.SCAN_BATCH:
+                self._matches = None
+            elif deadline is not None and time.monotonic() >= deadline:
+                return False
+        while self._pos is not None:
+            end = self._pos + self.SCAN_WINDOW
+            if end >= len(text):
+                end = limit = len(text)
+            else:
+                limit = end - self.SCAN_OVERLAP
+            resume = limit
+            for match in self.pattern.finditer(text, self._pos, end):
+                if match.start() >= limit:
+                    break
+                if match.end() > match.start():
+                    self.starts.append(match.start())
+                    self.ends.append(match.end())
+                resume = max(resume, match.end())
+            self._pos = resume if end < len(text) else None
+            if self._pos is not None and deadline is not None and time.monotonic() >= deadline:
+                return False
+        return True
+
+    def __len__(self):
+        return len(self.starts)
+
+    def matches(self, pattern, buffer):
+        return pattern == self.pattern and buffer is self.buffer and buffer.version == self.version
+
+    def tk_index(self, offset):
+        line = bisect.bisect_right(self.line_starts, offset)
+        start = self.line_starts[line - 1]
+        col = offset - start
+        if ASTRAL is not None:
+            col += len(ASTRAL.findall(self._text, start, offset))
+        return f"{line}.{col}"
+
+    def tk_ranges(self, first=0, last=None):
+        # Flat start, end, start, end... index list for a single tag_add call;
+        # matches do not overlap, so the offsets never go backwards
+        if last is None:
+            last = len(self.starts)
+        offsets = []
+        for i in range(first, last):
+            offsets.append(self.starts[i])
+            offsets.append(self.ends[i])
+        return tk_indices(self.line_starts, offsets, self._text)
+
+    def next_match(self, offset):
+        # Index of the first match starting at or after offset, wrapping round
+        if not self.starts:
+            return None
+        i = bisect.bisect_left(self.starts, offset)
+        return i if i < len(self.starts) else 0
+
+class WordIndex:
+    WORD = re.compile(r'\b\w+\b')
+
+    def __init__(self, text='', counts=None):
+        self.reset(text, counts)
+
+    def reset(self, text='', counts=None):
+        self.counts = collections.Counter(counts if counts is not None else self.WORD.findall(text))
+        # Sorted by lowercase so a prefix lookup is a bisect plus a short scan
+        self.keys = sorted((word.lower(), word) for word in self.counts)
+
+    def _update(self, word, delta):
+        count = self.counts.get(word, 0) + delta
+        if count > 0:
+            if word not in self.counts:
+                bisect.insort(self.keys, (word.lower(), word))
+            self.counts[word] = count
+        elif word in self.counts:
+            del self.counts[word]
+            del self.keys[bisect.bisect_left(self.keys, (word.lower(), word))]
+
+    def add_text(self, text):
+        for word, count in collections.Counter(self.WORD.findall(text)).items():
+            self._update(word, count)
+
+    def remove_text(self, text):
+        for word, count in collections.Counter(self.WORD.findall(text)).items():
+            self._update(word, -count)
+
+    def update_counts(self, old, new):
+        for word in set(old) | set(new):
+            delta = new.get(word, 0) - old.get(word, 0)
+            if delta:
+                self._update(word, delta)
+
+    def complete(self, prefix):
+        key = prefix.lower()
+        i = bisect.bisect_left(self.keys, (key,))
+        matches = []
+        while i < len(self.keys) and self.keys[i][0].startswith(key):
+            if self.keys[i][0] != key:
+                matches.append(self.keys[i][1])
+            i += 1
+        return matches
+
+class AcceptedWords:
+    # Bounded LRU of accepted completions; the most recent score highest
+    def __init__(self, size=ACCEPTED_LRU_SIZE):
+        self.size = size
+        self.words = collections.OrderedDict()  # word -> tick when last accepted
+        self.tick = 0
+
+    def add(self, word):
+        self.tick += 1
+        self.words[word] = self.tick
+        self.words.move_to_end(word)
+        if len(self.words) > self.size:
+            self.words.popitem(last=False)
+
+    def recency(self, word):
+        tick = self.words.get(word)
+        if tick is None:
+            return 0.0
+        return 1.0 - (self.tick - tick) / self.size
+
+def walk_files(root):
+    # Every file under root, skipping hidden directories
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [name for name in dirnames if not name.startswith('.')]
+        for name in filenames:
+            yield os.path.join(dirpath, name)
+
+class WorkerPool:
+    # One process pool shared by the background indexers and searches,
+    # started the first time work is submitted
+    def __init__(self):
+        self.executor = None
+        self.workers = max(1, (os.cpu_count() or 2) - 1)
+
+    def submit(self, fn, *args):
+        if self.executor is None:
+            self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+        return self.executor.submit(fn, *args)
+
+    def close(self):
+        # Drop queued work; exit only waits for batches already running
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+
+def tokenize_files(paths):
+    # Runs in a worker process; returns one word-frequency table for the batch
+    counts = collections.Counter()
+    for path in paths:
+        try:
+            if os.path.getsize(path) > WORKSPACE_MAX_FILE_SIZE:
+                continue
+            kind, encoding = sniff_file(path)
+            if kind != 'text':
+                continue
+            with open(path, 'r', encoding=encoding, errors='replace') as file:
+                counts.update(WordIndex.WORD.findall(file.read()))
+        except (OSError, LookupError):
+            continue
+    # One and two letter words are not worth sending back
+    return {word: count for word, count in counts.items() if len(word) > 2}
+
+class WorkspaceIndex:
+    # Word index over the files under a directory. A background thread walks
+    # the tree and farms batches out to a process pool; the finished index is
+    # swapped in whole, so the Tk thread only ever reads self.words
+    def __init__(self, pool):
+        self.root = None
+        self.words = WordIndex()
+        self.generation = 0
+        self.pool = pool
+        self.building = False
+        # Directories holding the indexed files, set when a build finishes
+        self.directories = frozenset()
+
+    def refresh(self, root):
+        first_build = root != self.root
+        if first_build:
+            self.words = WordIndex()
+            self.directories = frozenset()
+        self.root = root
+        self.building = True
+        self.generation += 1
+        threading.Thread(target=self.build, args=(root, self.generation, first_build), daemon=True).start()
+
+    def build(self, root, generation, first_build):
+        counts = collections.Counter()
+        directories = set()
+        pending = set()
+        publish_at = time.monotonic() + 0.5
+
+        def collect(return_when):
+            nonlocal pending, publish_at
+            done, pending = concurrent.futures.wait(pending, return_when=return_when)
+            for future in done:
+                try:
+                    counts.update(future.result())
+                except Exception:
+                    continue
+            # A first build shows partial results as they arrive, less often
+            # as the table grows; a rebuild keeps serving the old index until done
+            if first_build and time.monotonic() >= publish_at and generation == self.generation:
+                self.words = WordIndex(counts=counts)
+                publish_at = time.monotonic() + max(0.5, len(counts) / 200000)
+
+        paths = itertools.islice(walk_files(root), WORKSPACE_MAX_FILES)
+        while True:
+            batch = list(itertools.islice(paths, WORKSPACE_BATCH_FILES))
+            if generation != self.generation:
+                for future in pending:
+                    future.cancel()
+                return
+            if not batch:
+                break
+            directories.update(os.path.dirname(path) for path in batch)
+            pending.add(self.pool.submit(tokenize_files, batch))
+            # Keep only a few batches in flight so a cancelled build stops quickly
+            if len(pending) >= 2 * self.pool.workers:
+                collect(concurrent.futures.FIRST_COMPLETED)
+        collect(concurrent.futures.ALL_COMPLETED)
+        if generation == self.generation:
+            self.words = WordIndex(counts=counts)
+            self.directories = frozenset(directories)
+            self.building = False
+
+    def covers(self, path):
+        # True if a build would index path: it is under the root and not in
+        # a hidden directory
+        if self.root is None:
+            return False
+        root = os.path.join(os.path.abspath(self.root), '')
+        path = os.path.abspath(path)
+        if not path.startswith(root):
+            return False
+        return not any(part.startswith('.') for part in path[len(root):].split(os.sep)[:-1])
+
+    def track_save(self, path, write):
+        # Runs on the save thread around write(); returns the file's word
+        # counts before and after, for update_file
+        old = tokenize_files([path])
+        write()
+        return old, tokenize_files([path])
+
+    def update_file(self, old, new):
+        # Patch in one saved file instead of re-reading the tree. A build in
+        # progress reads the file itself
+        if not self.building:
+            self.words.update_counts(old, new)
+
+    def complete(self, prefix, root):
+        if root != self.root:
+            self.refresh(root)
+        return self.words.complete(prefix)
+
+def grep_files(paths, pattern):
+    # Runs in a worker process; returns (path, line, preview) for each
+    # matching line in the batch
+    results = []
+    for path in paths:
+        try:
+            if os.path.getsize(path) == 0:
+                continue
+            kind, encoding = sniff_file(path)
+            if kind != 'text' or encoding not in PAGED_ENCODINGS:
+                continue
+            results.extend(grep_file(path, compile_bytes_search(pattern, encoding), encoding))
+        except (OSError, ValueError, re.error):
+            # A pattern that cannot be written in the file's encoding cannot match it
+            continue
+    return results
+
+def grep_file(path, pattern, encoding):
+    results = []
+    with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+        size = len(view)
+        start = 0
+        line = 1
+        while start < size:
+            # Read the mapping a few MB at a time, cut on a line break so
+            # no match straddles two chunks
+            end = view.find(b'\n', min(start + GREP_CHUNK_BYTES, size))
+            end = size if end < 0 else end + 1
+            chunk = view[start:end]
+            counted = 0
+            last_line = 0
+            for match in pattern.finditer(chunk):
+                line += chunk.count(b'\n', counted, match.start())
+                counted = match.start()
+                if line == last_line:
+                    continue
+                last_line = line
+                line_start = chunk.rfind(b'\n', 0, match.start()) + 1
+                line_end = chunk.find(b'\n', match.start())
+                if line_end < 0:
+                    line_end = len(chunk)
+                preview = chunk[line_start:line_end].decode(encoding, 'replace').strip()
+                results.append((path, line, preview[:GREP_PREVIEW_CHARS]))
+            line += chunk.count(b'\n', counted)
+            start = end
+    return results
+
+def scan_files(root):
+    # Like walk_files, but yields (path, stat) using what scandir already read
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not entry.name.startswith('.'):
+                            stack.append(entry.path)
+                    elif entry.is_file():
+                        yield entry.path, entry.stat()
+        except OSError:
+            continue
+
+# One escape sequence in a regular expression, whatever its length
+REGEX_ESCAPE = re.compile(r'\\(?:x[0-9a-fA-F]{2}|u[0-9a-fA-F]{4}|U[0-9a-fA-F]{8}|N\{[^}]*\}'
+                          r'|0[0-7]{0,2}|[1-7][0-7]{2}|\d{1,2}|.)', re.DOTALL)
+
+def required_literals(pattern):
+    # Runs of plain characters that every match of the pattern contains, or
+    # None when an alternation or verbose mode makes that unsafe to work out.
+    # Groups and classes are skipped, since they may be optional or repeated
+    source = pattern.pattern
+    if pattern.flags & re.VERBOSE or '|' in source or re.search(r'\(\?[a-zA-Z-]*x', source):
+        return None
+    runs = []
+    run = ''
+    last_literal = False
+    i = 0
+    while i < len(source):
+        char = source[i]
+        literal = None
+        if char == '\\':
+            # Escapes such as \x6e, \N{...}, octal and backreferences span
+            # several characters; they end the run rather than join it
+            escape = REGEX_ESCAPE.match(source, i)
+            escaped = escape.group()[1:] if escape else ''
+            literal = {'n': '\n', 't': '\t'}.get(escaped, escaped if len(escaped) == 1 and not escaped.isalnum() else None)
+            i = escape.end() if escape else i + 1
+        elif char == '[':
+            i = skip_class(source, i)
+        elif char == '(':
+            depth = 0
+            while i < len(source):
+                if source[i] == '\\':
+                    i += 2
+                    continue
+                if source[i] == '[':
+                    i = skip_class(source, i)
+                    continue
+                depth += {'(': 1, ')': -1}.get(source[i], 0)
+                i += 1
+                if depth == 0:
+                    break
+        elif char in '*?+{':
+            quantifier = re.match(r'\{(\d*)(?:,(\d*))?\}', source[i:]) if char == '{' else None
+            if char != '{' or (quantifier and (quantifier.group(1) or quantifier.group(2) is not None)):
+                # The character before an optional quantifier may not appear
+                optional = char in '*?' or (quantifier and int(quantifier.group(1) or 0) == 0)
+                if last_literal and optional:
+                    run = run[:-1]
+                i += quantifier.end() if quantifier else 1
+            else:
+                literal = char
+                i += 1
+        elif char in '.^$)':
+            i += 1
+        else:
+            literal = char
+            i += 1
+        if literal is None or ord(literal) > 127:
+            runs.append(run)
+            run = ''
+            last_literal = False
+        else:
+            run += literal
+            last_literal = True
+    runs.append(run)
+    return [run for run in runs if len(run) >= 3]
+
+def skip_class(source, i):
+    # Index just past the [...] character class starting at i
+    i += 1
+    if source[i:i + 1] == '^':
+        i += 1
+    if source[i:i + 1] == ']':
+        i += 1
+    while i < len(source) and source[i] != ']':
+        i += 2 if source[i] == '\\' else 1
+    return i + 1
+
+TRIGRAM = re.compile(b'(?=(...))', re.DOTALL)
+
+def file_trigrams(paths):
+    # Runs in a worker process; returns (path, mtime_ns, size, trigrams) per
+    # file. trigrams is a sorted array of lowercased 3-byte keys, empty for
+    # files :grep skips anyway, or None for text too large to index
+    results = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            kind, encoding = sniff_file(path)
+            if kind != 'text' or encoding not in PAGED_ENCODINGS:
+                keys = array('I')
+            elif stat.st_size > TRIGRAM_MAX_FILE_SIZE:
+                keys = None
+            else:
+                with open(path, 'rb') as file:
+                    grams = set(TRIGRAM.findall(file.read().lower()))
+                keys = array('I', sorted(int.from_bytes(gram, 'big') for gram in grams))
+            results.append((path, stat.st_mtime_ns, stat.st_size, keys))
+        except (OSError, ValueError):
+            continue
+    return results
+
+def encode_postings(ids, last=-1):
+    # Gaps between ascending ids as little-endian base-128 varints
+    out = bytearray()
+    for file_id in ids:
+        gap = file_id - last
+        last = file_id
+        while gap >= 0x80:
+            out.append(gap & 0x7f | 0x80)
+            gap >>= 7
+        out.append(gap)
+    return out
+
+def decode_postings(data):
+    ids = []
+    last = -1
+    value = 0
+    shift = 0
+    for byte in data:
+        value |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            last += value
+            ids.append(last)
+            value = 0
+            shift = 0
+    return ids
+
+class TrigramIndex:
+    # On-disk trigram index of the files under a root, in native byte order:
+    #   header | posting offsets (Q, keys + 1) | keys (I) | last id per key (I)
+    #   | delta-varint posting lists | mtimes (q) | sizes (q) | flags (b) | paths
+    # Paths are relative to the root and NUL separated. A flag of 0 marks a
+    # file that changed or went away since it was indexed, 2 one too large to
+    # index. Queries map the file and binary search the keys in place
+    MAGIC = b'TNTRI001'
+    HEADER = struct.Struct('=8sQQQ')  # magic, key count, file count, postings size
+    DEAD, INDEXED, UNINDEXED = 0, 1, 2
+
+    @staticmethod
+    def path_for(root):
+        digest = hashlib.sha1(os.path.normcase(os.path.abspath(root)).encode('utf-8')).hexdigest()
+        return os.path.join(INDEX_DIR, digest[:20] + '.tri')
+
+    @classmethod
+    def find(cls, directory):
+        # The index covering directory, from it or its nearest indexed parent
+        directory = os.path.abspath(directory)
+        while True:
+            path = cls.path_for(directory)
+            if os.path.exists(path):
+                return directory, path
+            parent = os.path.dirname(directory)
+            if parent == directory:
+                return None
+            directory = parent
+
+    @classmethod
+    def layout(cls, key_count, file_count, postings_size):
+        offsets_at = cls.HEADER.size
+        keys_at = offsets_at + 8 * (key_count + 1)
+        lasts_at = keys_at + 4 * key_count
+        postings_at = lasts_at + 4 * key_count
+        mtimes_at = postings_at + postings_size
+        sizes_at = mtimes_at + 8 * file_count
+        flags_at = sizes_at + 8 * file_count
+        paths_at = flags_at + file_count
+        return offsets_at, keys_at, lasts_at, postings_at, mtimes_at, sizes_at, flags_at, paths_at
+
+    @classmethod
+    def load(cls, path):
+        # The whole index as arrays, for an incremental update
+        with open(path, 'rb') as file:
+            data = file.read()
+        magic, key_count, file_count, postings_size = cls.HEADER.unpack_from(data)
+        if magic != cls.MAGIC:
+            raise ValueError("not a trigram index")
+        offsets_at, keys_at, lasts_at, postings_at, mtimes_at, sizes_at, flags_at, paths_at = \
+            cls.layout(key_count, file_count, postings_size)
+        index = {}
+        for name, typecode, start, end in (('offsets', 'Q', offsets_at, keys_at), ('keys', 'I', keys_at, lasts_at),
+                                           ('lasts', 'I', lasts_at, postings_at), ('mtimes', 'q', mtimes_at, sizes_at),
+                                           ('sizes', 'q', sizes_at, flags_at), ('flags', 'b', flags_at, paths_at)):
+            index[name] = array(typecode)
+            index[name].frombytes(data[start:end])
+        index['postings'] = data[postings_at:mtimes_at]
+        index['paths'] = data[paths_at:].decode('utf-8').split('\0') if file_count else []
+        return index
+
+    @classmethod
+    def candidates(cls, path, literals):
+        # The relative paths of the indexed files that may match, from the
+        # posting lists of every trigram in the required literals, and the
+        # (mtime, size) each indexed file had, so files changed since can be
+        # told apart
+        grams = set()
+        for literal in literals:
+            literal = literal.lower().encode('ascii')
+            grams.update(int.from_bytes(literal[i:i + 3], 'big') for i in range(len(literal) - 2))
+        with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            magic, key_count, file_count, postings_size = cls.HEADER.unpack_from(view)
+            if magic != cls.MAGIC:
+                raise ValueError("not a trigram index")
+            offsets_at, keys_at, lasts_at, postings_at, mtimes_at, sizes_at, flags_at, paths_at = \
+                cls.layout(key_count, file_count, postings_size)
+            spans = []
+            for gram in grams:
+                lo, hi = 0, key_count
+                while lo < hi:
+                    mid = (lo + hi) // 2
+                    if struct.unpack_from('=I', view, keys_at + 4 * mid)[0] < gram:
+                        lo = mid + 1
+                    else:
+                        hi = mid
+                if lo == key_count or struct.unpack_from('=I', view, keys_at + 4 * lo)[0] != gram:
+                    spans = [(0, 0)]
+                    break
+                spans.append(struct.unpack_from('=QQ', view, offsets_at + 8 * lo))
+            # Intersect from the shortest list so the set stays small
+            spans.sort(key=lambda span: span[1] - span[0])
+            ids = None
+            for start, end in spans:
+                found = decode_postings(view[postings_at + start:postings_at + end])
+                ids = set(found) if ids is None else ids.intersection(found)
+                if not ids:
+                    break
+            flags = view[flags_at:paths_at]
+            mtimes, sizes = array('q'), array('q')
+            mtimes.frombytes(view[mtimes_at:sizes_at])
+            sizes.frombytes(view[sizes_at:flags_at])
+            paths = view[paths_at:].decode('utf-8').split('\0') if file_count else []
+        indexed = {paths[i]: (mtimes[i], sizes[i]) for i in range(file_count) if flags[i] == cls.INDEXED}
+        matches = {paths[i] for i in range(file_count)
+                   if flags[i] == cls.INDEXED and (ids is None or i in ids)}
+        return matches, indexed
+
+class TrigramIndexer:
+    # Builds and refreshes trigram indexes in the worker pool. Unchanged
+    # files (same mtime and size) keep their postings; changed and new files
+    # are read again and appended under new ids, and the old ids are marked
+    # dead. Once dead files outnumber live ones the index is rebuilt
+    def __init__(self, pool):
+        self.pool = pool
+        self.generation = 0
+        self.result = None  # (root, files, read, error) of the last finished run
+        self.running = False
+
+    def update(self, root):
+        self.generation += 1
+        self.result = None
+        self.running = True
+        threading.Thread(target=self.run, args=(os.path.abspath(root), self.generation), daemon=True).start()
+
+    def cancel(self):
+        self.generation += 1
+        self.running = False
+
+    def run(self, root, generation):
+        try:
+            read = self.build(root, generation)
+            if read is not None and generation == self.generation:
+                self.result = (root, read[0], read[1], None)
+        except Exception as e:
+            if generation == self.generation:
+                self.result = (root, 0, 0, e)
+        if generation == self.generation:
+            self.running = False
+
+    def build(self, root, generation):
+        path = TrigramIndex.path_for(root)
+        old = None
+        if os.path.exists(path):
+            try:
+                old = TrigramIndex.load(path)
+            except (OSError, ValueError, UnicodeDecodeError):
+                old = None
+        known = {}
+        if old is not None:
+            known = {rel: i for i, rel in enumerate(old['paths']) if old['flags'][i] != TrigramIndex.DEAD}
+
+        # Stat everything; only new or changed files get read
+        seen = set()
+        stale = []
+        for file_path, stat in scan_files(root):
+            if generation != self.generation:
+                return None
+            rel = os.path.relpath(file_path, root)
+            file_id = known.get(rel)
+            if file_id is not None and old['mtimes'][file_id] == stat.st_mtime_ns and old['sizes'][file_id] == stat.st_size:
+                seen.add(file_id)
+            else:
+                stale.append(file_path)
+        if old is not None:
+            for file_id in known.values():
+                if file_id not in seen:
+                    old['flags'][file_id] = TrigramIndex.DEAD
+            dead = old['flags'].count(TrigramIndex.DEAD)
+            if dead > len(old['flags']) - dead:
+                # Mostly dead weight; start over from every live file
+                stale.extend(os.path.join(root, rel) for rel, i in known.items() if i in seen)
+                old = None
+
+        paths = old['paths'] if old is not None else []
+        mtimes = old['mtimes'] if old is not None else array('q')
+        sizes = old['sizes'] if old is not None else array('q')
+        flags = old['flags'] if old is not None else array('b')
+        postings = collections.defaultdict(lambda: array('I'))
+        pending = set()
+
+        def collect(return_when):
+            nonlocal pending
+            done, pending = concurrent.futures.wait(pending, return_when=return_when)
+            for future in done:
+                for file_path, mtime, size, keys in future.result():
+                    file_id = len(paths)
+                    paths.append(os.path.relpath(file_path, root))
+                    mtimes.append(mtime)
+                    sizes.append(size)
+                    flags.append(TrigramIndex.UNINDEXED if keys is None else TrigramIndex.INDEXED)
+                    for key in keys or ():
+                        postings[key].append(file_id)
+
+        batches = iter(stale)
+        while True:
+            batch = list(itertools.islice(batches, TRIGRAM_BATCH_FILES))
+            if generation != self.generation:
+                for future in pending:
+                    future.cancel()
+                return None
+            if not batch:
+                break
+            pending.add(self.pool.submit(file_trigrams, batch))
+            if len(pending) >= 2 * self.pool.workers:
+                collect(concurrent.futures.FIRST_COMPLETED)
+        collect(concurrent.futures.ALL_COMPLETED)
+        if generation != self.generation:
+            return None
+
+        # Merge: existing lists are copied as they are and new ids, all
+        # higher than the old ones, are appended after the list's last id
+        old_keys = old['keys'] if old is not None else array('I')
+        keys = array('I', sorted(set(old_keys).union(postings)))
+        offsets = array('Q', [0])
+        lasts = array('I')
+        blob = bytearray()
+        position = {key: i for i, key in enumerate(old_keys)}
+        for key in keys:
+            i = position.get(key)
+            last = -1
+            if i is not None:
+                blob += old['postings'][old['offsets'][i]:old['offsets'][i + 1]]
+                last = old['lasts'][i]
+            ids = postings.get(key)
+            if ids:
+                blob += encode_postings(ids, last)
+                last = ids[-1]
+            offsets.append(len(blob))
+            lasts.append(last)
+
+        os.makedirs(INDEX_DIR, exist_ok=True)
+        header = TrigramIndex.HEADER.pack(TrigramIndex.MAGIC, len(keys), len(paths), len(blob))
+        atomic_write(path, (header, offsets.tobytes(), keys.tobytes(), lasts.tobytes(), bytes(blob),
+                            mtimes.tobytes(), sizes.tobytes(), flags.tobytes(),
+                            '\0'.join(paths).encode('utf-8')), binary=True)
+        return len(paths) - flags.count(TrigramIndex.DEAD), len(stale)
+
+def count_file_matches(paths, pattern):
+    # Runs in a worker process; returns (path, count, mtime_ns) for each
+    # text file in the batch that has matches
+    results = []
+    for path in paths:
+        try:
+            kind, encoding = sniff_file(path)
+            if kind != 'text':
+                continue
+            mtime = os.stat(path).st_mtime_ns
+            with open(path, 'r', encoding=encoding, newline='') as file:
+                count = sum(1 for _ in pattern.finditer(file.read()))
+            if count:
+                results.append((path, count, mtime))
+        except (OSError, UnicodeDecodeError, LookupError):
+            continue
+    return results
+
+def replace_in_file(path, pattern, replacement, mtime):
+    # Runs in a worker process; rewrites one file through atomic_write and
+    # returns the number of replacements, or None if it is no longer text.
+    # Line endings are left as they are
+    if os.stat(path).st_mtime_ns != mtime:
+        raise RuntimeError("changed on disk since the preview")
+    kind, encoding = sniff_file(path)
+    if kind != 'text':
+        return None
+    with open(path, 'r', encoding=encoding, newline='') as file:
+        text = file.read()
+    text, count = pattern.subn(replacement, text)
+    if count:
+        atomic_write(path, [text.encode(encoding)], binary=True)
+    return count
+
+class GrepSearch:
+    # Searches the files under a directory in the worker pool. A background
+    # thread walks the tree and hands out batches; finished batches go on a
+    # queue that the Tk thread drains, ending with None
+    def __init__(self, pool):
+        self.pool = pool
+        self.generation = 0
+        self.results = queue.Queue()
+        self.files = 0
+        self.indexed_root = None
+
+    def start(self, root, pattern, glob=None, task=grep_files):
+        # task(paths, pattern) runs in the pool and returns a list of results
+        self.generation += 1
+        # A fresh queue, so results from a cancelled search never show up
+        self.results = queue.Queue()
+        self.files = 0
+        self.indexed_root = None  # set when a trigram index narrowed the search
+        threading.Thread(target=self.run, args=(root, pattern, glob, task, self.generation, self.results),
+                         daemon=True).start()
+
+    def cancel(self):
+        self.generation += 1
+
+    def run(self, root, pattern, glob, task, generation, results):
+        pending = set()
+
+        def collect(return_when):
+            nonlocal pending
+            done, pending = concurrent.futures.wait(pending, return_when=return_when)
+            for future in done:
+                try:
+                    batch = future.result()
+                except Exception:
+                    continue
+                if batch:
+                    results.put(batch)
+
+        paths = None
+        index = TrigramIndex.find(root)
+        literals = required_literals(pattern)
+        if index is not None and literals:
+            index_root, index_path = index
+            try:
+                matches, indexed = TrigramIndex.candidates(index_path, literals)
+                self.indexed_root = index_root
+            except (OSError, ValueError, UnicodeDecodeError):
+                matches = None
+            if matches is not None:
+                # Only unchanged indexed files are narrowed by trigram: files
+                # that are new, too large to index or changed since are
+                # always searched
+                def narrowed():
+                    for path, stat in scan_files(root):
+                        rel = os.path.relpath(path, index_root)
+                        if indexed.get(rel) != (stat.st_mtime_ns, stat.st_size) or rel in matches:
+                            yield path
+                paths = narrowed()
+        if paths is None:
+            paths = walk_files(root)
+        if glob:
+            paths = (path for path in paths if fnmatch.fnmatch(os.path.basename(path), glob))
+        paths = iter(paths)
+        while True:
+            batch = list(itertools.islice(paths, GREP_BATCH_FILES))
+            if generation != self.generation:
+                for future in pending:
+                    future.cancel()
+                return
+            if not batch:
+                break
+            self.files += len(batch)
+            pending.add(self.pool.submit(task, batch, pattern))
+            if len(pending) >= 2 * self.pool.workers:
+                collect(concurrent.futures.FIRST_COMPLETED)
+        collect(concurrent.futures.ALL_COMPLETED)
+        results.put(None)
+
+def read_ignore_file(path, base):
+    # gitignore-style rules as (base parts, pattern, directories only,
+    # anchored). Negated patterns are not supported and are skipped
+    rules = []
+    try:
+        with open(path, 'r', encoding='utf-8', errors='replace') as file:
+            lines = file.read().splitlines()
+    except OSError:
+        return rules
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#') or line.startswith('!'):
+            continue
+        dir_only = line.endswith('/')
+        line = line.rstrip('/')
+        if line.startswith('**/'):
+            line = line[3:]
+        anchored = '/' in line
+        line = line.lstrip('/')
+        if line:
+            rules.append((base, line, dir_only, anchored))
+    return rules
+
+def is_ignored(rules, parts, name, is_dir):
+    for base, pattern, dir_only, anchored in rules:
+        if dir_only and not is_dir:
+            continue
+        if anchored:
+            if fnmatch.fnmatchcase('/'.join(parts[len(base):] + (name,)), pattern):
+                return True
+        elif fnmatch.fnmatchcase(name, pattern):
+            return True
+    return False
+
+class FileList:
+    # Every file under a root, for :o. Each distinct file or directory name
+    # is stored once in segments and a path is the run of segment ids from
+    # starts[i] to starts[i + 1], in sorted path order. On disk, in native
+    # byte order:
+    #   header | starts (Q, paths + 1) | ids (I) | NUL separated segments
+    MAGIC = b'TNFLS001'
+    HEADER = struct.Struct('=8sQQQ')  # magic, path count, id count, segment bytes
+
+    def __init__(self, root, segments=(), ids=None, starts=None):
+        self.root = root
+        self.segments = list(segments)
+        self.ids = ids if ids is not None else array('I')
+        self.starts = starts if starts is not None else array('Q', [0])
+        self.names = None  # joined relative paths, built once for matching
+
+    def __len__(self):
+        return len(self.starts) - 1
+
+    def path(self, i):
+        return os.sep.join(self.segments[j] for j in self.ids[self.starts[i]:self.starts[i + 1]])
+
+    def paths(self):
+        if self.names is None:
+            self.names = [self.path(i) for i in range(len(self))]
+        return self.names
+
+    @classmethod
+    def build(cls, root, paths):
+        # paths are sorted tuples of path segments
+        numbers = {}
+        files = cls(root)
+        for parts in paths:
+            for part in parts:
+                number = numbers.get(part)
+                if number is None:
+                    number = numbers[part] = len(files.segments)
+                    files.segments.append(part)
+                files.ids.append(number)
+            files.starts.append(len(files.ids))
+        return files
+
+    @staticmethod
+    def path_for(root):
+        digest = hashlib.sha1(os.path.normcase(os.path.abspath(root)).encode('utf-8')).hexdigest()
+        return os.path.join(INDEX_DIR, digest[:20] + '.files')
+
+    def save(self):
+        os.makedirs(INDEX_DIR, exist_ok=True)
+        segments = '\0'.join(self.segments).encode('utf-8', 'surrogateescape')
+        header = self.HEADER.pack(self.MAGIC, len(self), len(self.ids), len(segments))
+        atomic_write(self.path_for(self.root), [header, self.starts.tobytes(), self.ids.tobytes(), segments],
+                     binary=True)
+
+    @classmethod
+    def load(cls, root):
+        with open(cls.path_for(root), 'rb') as file:
+            data = file.read()
+        magic, path_count, id_count, segments_size = cls.HEADER.unpack_from(data)
+        if magic != cls.MAGIC:
+            raise ValueError("not a file list")
+        starts_at = cls.HEADER.size
+        ids_at = starts_at + 8 * (path_count + 1)
+        segments_at = ids_at + 4 * id_count
+        starts, ids = array('Q'), array('I')
+        starts.frombytes(data[starts_at:ids_at])
+        ids.frombytes(data[ids_at:segments_at])
+        segments = data[segments_at:segments_at + segments_size].decode('utf-8', 'surrogateescape')
+        return cls(root, segments.split('\0') if segments_size else [], ids, starts)
+
+class FileCrawler:
+    # Builds the FileList for a root with os.scandir on a background thread,
+    # skipping hidden directories, FILE_LIST_IGNORE and whatever .gitignore
+    # and .ignore files exclude. The list saved by the last crawl is loaded
+    # first, so a new session can search at once while the crawl refreshes it
+    def __init__(self):
+        self.generation = 0
+        self.root = None
+        self.files = None  # the latest FileList for root
+        self.running = False
+        self.crawled_at = 0
+        self.error = None
+
+    def start(self, root):
+        root = os.path.abspath(root)
+        if root != self.root:
+            self.files = None
+        self.generation += 1
+        self.root = root
+        self.running = True
+        self.error = None
+        threading.Thread(target=self.run, args=(root, self.generation), daemon=True).start()
+
+    def cancel(self):
+        self.generation += 1
+        self.running = False
+
+    def run(self, root, generation):
+        try:
+            if self.files is None:
+                try:
+                    files = FileList.load(root)
+                    files.paths()
+                    if generation == self.generation:
+                        self.files = files
+                except (OSError, ValueError, UnicodeDecodeError):
+                    pass
+            files = self.crawl(root, generation)
+            if files is not None and generation == self.generation:
+                files.paths()
+                self.files = files
+                self.crawled_at = time.monotonic()
+                files.save()
+        except Exception as e:
+            if generation == self.generation:
+                self.error = e
+        if generation == self.generation:
+            self.running = False
+
+    def crawl(self, root, generation):
+        interned = {}
+        paths = []
+        defaults = [((), name, True, False) for name in FILE_LIST_IGNORE]
+        stack = [((), defaults)]  # (relative parts, ignore rules in effect)
+        while stack and len(paths) < FILE_LIST_MAX_FILES:
+            if generation != self.generation:
+                return None
+            parts, rules = stack.pop()
+            try:
+                with os.scandir(os.path.join(root, *parts)) as scan:
+                    entries = list(scan)
+            except OSError:
+                continue
+            present = {entry.name for entry in entries}
+            for name in FILE_LIST_IGNORE_FILES:
+                if name in present:
+                    rules = rules + read_ignore_file(os.path.join(root, *parts, name), parts)
+            for entry in entries:
+                try:
+                    # Symlinked directories are not followed, so links cannot loop
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                except OSError:
+                    continue
+                if is_dir and entry.name.startswith('.'):
+                    continue
+                if rules and is_ignored(rules, parts, entry.name, is_dir):
+                    continue
+                name = interned.setdefault(entry.name, entry.name)
+                if is_dir:
+                    stack.append((parts + (name,), rules))
+                else:
+                    paths.append(parts + (name,))
+        paths.sort()
+        return FileList.build(root, paths)
+
+def format_size(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024:
+            break
+        size /= 1024
+    else:
+        unit = 'TB'
+    return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+
+class JobCancelled(Exception):
+    pass
+
+class Job:
+    # A copy, move or delete run by the JobManager on a worker thread. The
+    # worker updates the counters and state; the jobs panel only reads them
+    def __init__(self, kind, source, destination=None):
+        self.kind = kind
+        self.source = source
+        self.destination = destination
+        self.state = 'waiting'  # then 'running', 'done', 'failed' or 'cancelled'
+        self.error = None
+        self.files_total = self.bytes_total = 0
+        self.files_done = self.bytes_done = 0
+        self.cancelled = threading.Event()
+        self.reported = False
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def check(self):
+        if self.cancelled.is_set():
+            raise JobCancelled()
+
+    def finished(self):
+        return self.state in ('done', 'failed', 'cancelled')
+
+    def run(self):
+        if self.kind == 'copy':
+            self.copy(self.source, self.destination)
+        elif self.kind == 'move':
+            self.move(self.source, self.destination)
+        else:
+            self.count_files(self.source)
+            self.remove(self.source)
+
+    def count_files(self, path):
+        # The total for the progress display
+        if not os.path.isdir(path) or os.path.islink(path):
+            self.files_total = 1
+            return
+        for dirpath, dirnames, filenames in os.walk(path):
+            self.check()
+            self.files_total += len(filenames)
+
+    def copy(self, source, destination):
+        engine = CopyEngine(self)
+        try:
+            engine.copy(source, destination)
+        except BaseException:
+            # Only a destination this job created is removed, never one that
+            # appeared while it was queued
+            if engine.created:
+                if os.path.isdir(destination) and not os.path.islink(destination):
+                    shutil.rmtree(destination, ignore_errors=True)
+                else:
+                    os.remove(destination)
+            raise
+
+    def move(self, source, destination):
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        try:
+            # Within one filesystem a move is a rename, whatever its size
+            os.rename(source, destination)
+            self.files_total = self.files_done = 1
+            return
+        except OSError as e:
+            # Any other failure (permissions, a destination that appeared
+            # meanwhile) is an error, not a reason to copy instead
+            if e.errno != errno.EXDEV:
+                raise
+        # Across filesystems, copy, then remove the source once the copy is complete
+        self.copy(source, destination)
+        self.remove(source, cancellable=False)
+
+    def remove(self, path, cancellable=True):
+        if not os.path.isdir(path) or os.path.islink(path):
+            os.remove(path)
+            if cancellable:
+                self.files_done += 1
+            return
+        for dirpath, dirnames, filenames in os.walk(path, topdown=False):
+            for name in filenames:
+                if cancellable:
+                    self.check()
+                    self.files_done += 1
+                os.remove(os.path.join(dirpath, name))
+            for name in dirnames:
+                # Links to directories are listed but not walked into
+                child = os.path.join(dirpath, name)
+                if os.path.islink(child):
+                    os.remove(child)
+                else:
+                    os.rmdir(child)
+        os.rmdir(path)
+
+class CopyEngine:
+    # Copies a file or a directory tree for a Job. The tree is walked with
+    # os.scandir and its files are copied by a pool of threads as the walk
+    # finds them, each through the fastest path that works: a reflink
+    # (FICLONE), then copy_file_range, then sendfile, then plain reads and
+    # writes. Like shutil.copytree, linked directories and files are copied
+    # as what they point to. Metadata is copied in a second pass, once no
+    # more writes can change a directory's mtime
+    def __init__(self, job):
+        self.job = job
+        self.created = False  # whether the destination was created by this copy
+        self.lock = threading.Lock()  # guards the job's done counters
+        self.stopped = False
+        self.files = []  # (source, destination) of every file copied
+        self.skipped = []  # FIFOs, sockets and devices, which cannot be copied
+        self.directories = []  # (source, destination), parents first
+        # Paths found not to work are dropped for the rest of the copy
+        self.reflink = fcntl is not None and sys.platform.startswith('linux')
+        self.copy_range = hasattr(os, 'copy_file_range')
+        self.sendfile = hasattr(os, 'sendfile') and sys.platform.startswith('linux')
+
+    def check(self):
+        if self.stopped:
+            raise JobCancelled()
+        self.job.check()
+
+    def copy(self, source, destination):
+        job = self.job
+        if not os.path.isdir(source):
+            size = os.stat(source).st_size
+            job.files_total, job.bytes_total = 1, size
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            # Fails if the destination exists by now
+            os.close(os.open(destination, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666))
+            self.created = True
+            self.copy_files([(source, destination, size)])
+            shutil.copystat(source, destination)
+            return
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=COPY_WORKERS) as pool:
+            pending = set()
+            try:
+                for batch in self.walk(source, destination):
+                    pending.add(pool.submit(self.copy_files, batch))
+                    if len(pending) >= 4 * COPY_WORKERS:
+                        done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                        for future in done:
+                            future.result()
+                done, pending = concurrent.futures.wait(pending)
+                for future in done:
+                    future.result()
+                if self.skipped:
+                    raise OSError(f"Cannot copy special files: {', '.join(self.skipped[:5])}"
+                                  + (f" and {len(self.skipped) - 5} more" if len(self.skipped) > 5 else ""))
+
+                # Second pass: file metadata in parallel, then the
+                # directories deepest first
+                files = iter(self.files)
+                batches = iter(lambda: list(itertools.islice(files, COPY_BATCH_FILES)), [])
+                for future in [pool.submit(self.copy_stats, batch) for batch in batches]:
+                    future.result()
+            except BaseException:
+                # Let the other threads give up at their next check
+                self.stopped = True
+                for future in pending:
+                    future.cancel()
+                raise
+        for directory, target in reversed(self.directories):
+            shutil.copystat(directory, target)
+
+    def walk(self, source, destination):
+        # Creates the directories and yields batches of (source, destination,
+        # size) for the files in them
+        job = self.job
+        batch, batch_bytes = [], 0
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        stack = [(source, destination)]
+        while stack:
+            self.check()
+            directory, target = stack.pop()
+            # Every directory is new, the top one included; an existing
+            # destination fails here instead of being merged into
+            os.mkdir(target)
+            if target == destination:
+                self.created = True
+            self.directories.append((directory, target))
+            with os.scandir(directory) as scan:
+                for entry in scan:
+                    path, dest = entry.path, os.path.join(target, entry.name)
+                    if entry.is_dir():
+                        stack.append((path, dest))
+                    elif entry.is_file():
+                        size = entry.stat().st_size
+                        job.files_total += 1
+                        job.bytes_total += size
+                        self.files.append((path, dest))
+                        batch.append((path, dest, size))
+                        batch_bytes += size
+                        if len(batch) >= COPY_BATCH_FILES or batch_bytes >= COPY_BATCH_BYTES:
+                            yield batch
+                            batch, batch_bytes = [], 0
+                    elif entry.is_symlink():
+                        # A link whose target is missing is copied as a link
+                        os.symlink(os.readlink(path), dest)
+                        job.files_total += 1
+                        with self.lock:
+                            job.files_done += 1
+                    else:
+                        self.skipped.append(path)
+        if batch:
+            yield batch
+
+    def copy_files(self, batch):
+        for source, destination, size in batch:
+            self.check()
+            with open(source, 'rb') as src, open(destination, 'wb') as dst:
+                if not ((self.reflink and self.clone(src, dst, size))
+                        or (self.copy_range and self.copy_kernel(src, dst, size, os.copy_file_range))
+                        or (self.sendfile and self.copy_kernel(src, dst, size, self.send))):
+                    self.copy_chunks(src, dst)
+            with self.lock:
+                self.job.files_done += 1
+
+    def copy_stats(self, batch):
+        for source, destination in batch:
+            self.check()
+            shutil.copystat(source, destination)
+
+    def clone(self, src, dst, size):
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            # Not a reflink filesystem, or source and destination differ
+            self.reflink = False
+            return False
+        with self.lock:
+            self.job.bytes_done += size
+        return True
+
+    def send(self, src_fd, dst_fd, count):
+        return os.sendfile(dst_fd, src_fd, None, count)
+
+    def copy_kernel(self, src, dst, size, call):
+        # The data moves inside the kernel, never through Python buffers
+        copied = 0
+        while True:
+            self.check()
+            try:
+                sent = call(src.fileno(), dst.fileno(), COPY_RANGE_BYTES)
+            except OSError as e:
+                if copied == 0 and e.errno in COPY_FALLBACK_ERRNOS:
+                    self.disable(call)
+                    return False
+                raise
+            if sent == 0:
+                if copied == 0 and size > 0:
+                    # Some filesystems report nothing copied rather than an error
+                    self.disable(call)
+                    return False
+                return True
+            copied += sent
+            with self.lock:
+                self.job.bytes_done += sent
+
+    def disable(self, call):
+        if call == self.send:
+            self.sendfile = False
+        else:
+            self.copy_range = False
+
+    def copy_chunks(self, src, dst):
+        buffer = bytearray(JOB_CHUNK_BYTES)
+        view = memoryview(buffer)
+        while True:
+            self.check()
+            read = src.readinto(buffer)
+            if not read:
+                break
+            dst.write(view[:read])
+            with self.lock:
+                self.job.bytes_done += read
+
+class JobManager:
+    # Runs Jobs on worker threads, several at once, but lets at most
+    # JOB_IO_LIMIT of them work on any one device (st_dev) at a time so jobs
+    # sharing a disk don't fight over it
+    def __init__(self):
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=JOB_WORKERS)
+        self.jobs = []
+        self.devices = {}  # st_dev -> semaphore
+        self.lock = threading.Lock()
+
+    def device(self, path):
+        # A destination that does not exist yet lives on its parent's device
+        while True:
+            try:
+                return os.stat(path).st_dev
+            except OSError:
+                parent = os.path.dirname(path)
+                if parent == path:
+                    return None
+                path = parent
+
+    def submit(self, job):
+        self.jobs.append(job)
+        self.executor.submit(self.run, job)
+        return job
+
+    def run(self, job):
+        devices = {self.device(job.source)}
+        if job.destination is not None:
+            devices.add(self.device(job.destination))
+        with self.lock:
+            semaphores = [self.devices.setdefault(device, threading.BoundedSemaphore(JOB_IO_LIMIT))
+                          for device in sorted(devices, key=str)]
+        # Taken in a fixed order, so two jobs never hold one each of the same pair
+        held = []
+        try:
+            for semaphore in semaphores:
+                while not semaphore.acquire(timeout=0.1):
+                    job.check()
+                held.append(semaphore)
+            job.check()
+            job.state = 'running'
+            job.run()
+            job.state = 'done'
+        except JobCancelled:
+            job.state = 'cancelled'
+        except Exception as e:
+            job.error = e
+            job.state = 'failed'
+        finally:
+            for semaphore in held:
+                semaphore.release()
+
+    def active(self):
+        return [job for job in self.jobs if not job.finished()]
+
+    def close(self):
+        # Cancelled copies clean up after themselves before exit
+        for job in self.jobs:
+            job.cancel()
+        self.executor.shutdown()
+
+class DirectoryCache:
+    # Directory listings read with os.scandir, keeping each entry's type,
+    # size and mtime. A listing is reused until the directory's own mtime
+    # changes, so an unchanged directory costs one stat instead of a listdir.
+    # At most DIR_CACHE_SIZE listings are kept, dropping the least recently used
+    def __init__(self):
+        # path -> (dir mtime_ns, trusted, {name: (is_dir, size, mtime_ns)}, sorted names)
+        self.listings = collections.OrderedDict()
+
+    def _listing(self, path):
+        path = os.path.abspath(path)
+        mtime = os.stat(path).st_mtime_ns
+        cached = self.listings.get(path)
+        if cached is not None and cached[0] == mtime and cached[1]:
+            self.listings.move_to_end(path)
+            return cached
+        entries = {}
+        with os.scandir(path) as scan:
+            for entry in scan:
+                try:
+                    stat = entry.stat()
+                    entries[entry.name] = (entry.is_dir(), stat.st_size, stat.st_mtime_ns)
+                except OSError:
+                    # A dangling link or an entry removed mid-scan
+                    entries[entry.name] = (False, 0, 0)
+        trusted = time.time_ns() - mtime > DIR_MTIME_SLACK_NS
+        cached = self.listings[path] = (mtime, trusted, entries, sorted(entries))
+        self.listings.move_to_end(path)
+        if len(self.listings) > DIR_CACHE_SIZE:
+            self.listings.popitem(last=False)
+        return cached
+
+    def names(self, path):
+        return self._listing(path)[3]
+
+    def entries(self, path):
+        return self._listing(path)[2]
+
+    def invalidate(self, path):
+        self.listings.pop(os.path.abspath(path), None)
+
+    def apply(self, path, changes):
+        # Patch a cached listing with known changes ({name: 'added' or
+        # 'removed'}) instead of rescanning it. Returns the names that
+        # appeared and disappeared, or None if the listing was not cached
+        path = os.path.abspath(path)
+        cached = self.listings.get(path)
+        if cached is None:
+            return None
+        entries, names = cached[2], cached[3]
+        added, removed = [], []
+        for name, kind in changes.items():
+            info = None
+            if kind == 'added':
+                try:
+                    stat = os.stat(os.path.join(path, name))
+                    info = (os.path.isdir(os.path.join(path, name)), stat.st_size, stat.st_mtime_ns)
+                except OSError:
+                    # Created and removed again before we got to it
+                    pass
+            if info is None:
+                if entries.pop(name, None) is not None:
+                    del names[bisect.bisect_left(names, name)]
+                    removed.append(name)
+            else:
+                if name not in entries:
+                    bisect.insort(names, name)
+                    added.append(name)
+                entries[name] = info
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            del self.listings[path]
+            return None
+        self.listings[path] = (mtime, time.time_ns() - mtime > DIR_MTIME_SLACK_NS, entries, names)
+        return added, removed
+
+def file_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+class DirectoryWatcher:
+    # Reports entries added to or removed from the watched directories and
+    # files written in them. With inotify each change arrives as one event;
+    # without it every directory's mtime is polled through the DirectoryCache
+    # and only a directory that changed is relisted
+    def __init__(self, cache):
+        self.cache = cache
+        self.libc = None
+        self.fd = None
+        self.watches = {}  # inotify wd -> directory
+        self.directories = {}  # directory -> wd, or its last seen names when polling
+        self.files = {}  # path -> mtime_ns, only when polling
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd >= 0:
+                self.libc = libc
+                self.fd = fd
+        except (OSError, AttributeError, TypeError):
+            # No inotify on this platform; fall back to polling
+            pass
+
+    def watch(self, directories, files=()):
+        directories = set(directories)
+        for directory in list(self.directories):
+            if directory not in directories:
+                watched = self.directories.pop(directory)
+                if self.fd is not None:
+                    self.watches.pop(watched, None)
+                    self.libc.inotify_rm_watch(self.fd, watched)
+        for directory in directories - set(self.directories):
+            if self.fd is not None:
+                wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+                if wd < 0:
+                    continue
+                self.watches[wd] = directory
+                self.directories[directory] = wd
+            else:
+                try:
+                    self.directories[directory] = self.cache.names(directory)
+                except OSError:
+                    continue
+        if self.fd is None:
+            self.files = {path: self.files[path] if path in self.files else file_mtime(path)
+                          for path in files}
+
+    def read(self):
+        # Returns (directory, name, kind) for every change since the last
+        # call, kind being 'added', 'removed' or 'written'. A name of None
+        # means the directory has to be relisted in full
+        if self.fd is None:
+            return self.poll()
+        changes = []
+        while True:
+            try:
+                data = os.read(self.fd, WATCH_READ_BYTES)
+            except OSError:
+                # Drained (EAGAIN)
+                break
+            if not data:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = INOTIFY_EVENT.unpack_from(data, offset)
+                offset += INOTIFY_EVENT.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    # The kernel dropped events
+                    changes.extend((directory, None, 'relist') for directory in self.directories)
+                    continue
+                directory = self.watches.get(wd)
+                if directory is None:
+                    continue
+                if mask & IN_IGNORED:
+                    # The directory is gone and so is its watch
+                    del self.watches[wd]
+                    self.directories.pop(directory, None)
+                    changes.append((directory, None, 'relist'))
+                elif mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                    changes.append((directory, None, 'relist'))
+                elif mask & (IN_CREATE | IN_MOVED_TO):
+                    changes.append((directory, name, 'added'))
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    changes.append((directory, name, 'removed'))
+                elif mask & IN_CLOSE_WRITE:
+                    changes.append((directory, name, 'written'))
+        return changes
+
+    def poll(self):
+        changes = []
+        for directory, seen in self.directories.items():
+            try:
+                names = self.cache.names(directory)
+            except OSError:
+                changes.append((directory, None, 'relist'))
+                continue
+            # The cache hands back the same list while the directory is unchanged
+            if names is seen:
+                continue
+            self.directories[directory] = names
+            before, after = set(seen), set(names)
+            changes.extend((directory, name, 'added') for name in after - before)
+            changes.extend((directory, name, 'removed') for name in before - after)
+        for path, mtime in self.files.items():
+            current = file_mtime(path)
+            if current != mtime:
+                self.files[path] = current
+                changes.append((os.path.dirname(path), os.path.basename(path), 'written'))
+        return changes
+
+def fuzzy_score(query, text):
+    # fzf's greedy scheme: the forward pass finds where the earliest match
+    # ends, the backward pass the latest start before that, and the window
+    # between them is scored. Returns None if query is not a subsequence
+    lower = text.lower()
+    if len(lower) != len(text):
+        # Lowercasing changed the length; match case-sensitively instead
+        lower = text
+    folded = query.lower() if lower is not text else query
+    i = -1
+    for ch in folded:
+        i = lower.find(ch, i + 1)
+        if i < 0:
+            return None
+    i += 1
+    for ch in reversed(folded):
+        i = lower.rfind(ch, 0, i)
+    score = 0
+    previous = i - 1
+    for n, ch in enumerate(folded):
+        i = lower.find(ch, previous + 1)
+        before = text[i - 1] if i else ''
+        if not i or before in '/\\_-. ':
+            bonus = FUZZY_BONUS_BOUNDARY
+        elif (before.islower() and text[i].isupper()) or (not before.isdigit() and text[i].isdigit()):
+            bonus = FUZZY_BONUS_CAMEL
+        else:
+            bonus = 0
+        if n and i == previous + 1:
+            bonus = max(bonus, FUZZY_BONUS_CONSECUTIVE)
+        elif n:
+            score -= FUZZY_GAP_START + (i - previous - 2) * FUZZY_GAP_EXTENSION
+        score += FUZZY_SCORE_MATCH + (2 * bonus if not n else bonus)
+        if text[i] == query[n]:
+            score += FUZZY_BONUS_CASE
+        previous = i
+    return score
+
+class FuzzyMatcher:
+    # Keeps the FUZZY_TOP_K best names for a query in a bounded heap. A regex
+    # built from the query rejects non-matching names at C speed so only
+    # real matches get scored, and the work is done in slices so a huge
+    # directory never holds up a frame. When the query only grows, the names
+    # that matched the shorter query are the only ones searched again
+    def __init__(self):
+        self.query = None
+        self.source = None
+        self.pool = []
+        self.position = 0
+        self.matched = []  # names from the pool that matched, in pool order
+        self.heap = []  # (score, -len(name), -match number, name)
+
+    def start(self, query, names, source=None):
+        # source identifies the listing names came from; a new one starts over
+        if (self.query is not None and source is self.source
+                and query.lower().startswith(self.query.lower())):
+            pool = self.matched + self.pool[self.position:]
+        else:
+            pool = names
+        self.query = query
+        self.source = source
+        self.pool = pool
+        self.position = 0
+        self.matched = []
+        self.heap = []
+        self.search = re.compile('.*?'.join(map(re.escape, query)), re.IGNORECASE | re.DOTALL).search
+
+    def scan(self, deadline=None):
+        # Returns True once every name has been tried
+        if not self.query:
+            self.matched = self.pool
+            self.position = len(self.pool)
+        heap = self.heap
+        while self.position < len(self.pool):
+            batch = self.pool[self.position:self.position + FUZZY_BATCH]
+            self.position += len(batch)
+            for name in filter(self.search, batch):
+                self.matched.append(name)
+                score = fuzzy_score(self.query, name)
+                if score is None:
+                    continue
+                entry = (score, -len(name), -len(self.matched), name)
+                if len(heap) < FUZZY_TOP_K:
+                    heapq.heappush(heap, entry)
+                elif entry > heap[0]:
+                    heapq.heapreplace(heap, entry)
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+        return True
+
+    def results(self):
+        if not self.query:
+            return self.pool[:FUZZY_TOP_K]
+        return [entry[3] for entry in sorted(self.heap, reverse=True)]
+
+class IdleScheduler:
+    # Named jobs run once per idle pass (delay 0) or once the debounce delay
+    # has passed without another request; repeated requests in between are
+    # coalesced into a single run with the latest arguments
+    def __init__(self, root):
+        self.root = root
+        self.jobs = {}  # name -> [after id, callback, args]
+
+    def schedule(self, name, callback, *args, delay=0):
+        job = self.jobs.get(name)
+        if job is not None:
+            if not delay:
+                job[1:] = [callback, args]
+                return
+            self.root.after_cancel(job[0])
+        run = lambda: self._run(name)
+        after_id = self.root.after(delay, run) if delay else self.root.after_idle(run)
+        self.jobs[name] = [after_id, callback, args]
+
+    def _run(self, name):
+        job = self.jobs.pop(name, None)
+        if job is not None:
+            job[1](*job[2])
+
+    def cancel(self, name):
+        job = self.jobs.pop(name, None)
+        if job is not None:
+            self.root.after_cancel(job[0])
+
+    def flush(self, name=None):
+        # Run pending jobs now instead of waiting for their turn
+        for job_name in ([name] if name is not None else list(self.jobs)):
+            job = self.jobs.get(job_name)
+            if job is not None:
+                self.root.after_cancel(job[0])
+                self._run(job_name)
 
 class TextEditor:
     def __init__(self, root):
@@ -12,6 +2465,26 @@ class TextEditor:
         self.root.title("TEX-NAV")
         self.root.geometry("1200x600")
 
+        # Per-keystroke work is queued here so bursts of input coalesce
+        self.scheduler = IdleScheduler(root)
+        self.root.tk.eval(TCL_REPLACE_RANGES)
+        # Background indexing and searching share one process pool
+        self.worker_pool = WorkerPool()
+        # Built on the first Ctrl+N for current_dir
+        self.workspace = WorkspaceIndex(self.worker_pool)
+        self.grep = GrepSearch(self.worker_pool)
+        self.replace_search = GrepSearch(self.worker_pool)
+        self.replace_files_window = None
+        self.indexer = TrigramIndexer(self.worker_pool)
+        # Copies, moves and deletes run as background jobs
+        self.jobs = JobManager()
+        self.jobs_window = None
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.jobs_polling = False
+        self.grep_window = None
+        self.grep_active = False
+        self.grep_results = []  # (path, line) for each row of the results panel
+
         # Configure dark mode colors
         self.bg_color = "#2E2E2E"  # Dark grey
         self.fg_color = "white"
@@ -108,7 +2581,7 @@ class TextEditor:
         self.query_entry = ttk.Entry(query_frame, font=('Courier', self.query_font_size), style='TEntry')
         self.query_entry.grid(row=0, column=1, sticky="ew")
         self.query_entry.bind('<Return>', self.process_query)
-        self.query_entry.bind('<KeyRelease>', self.update_suggestions)
+        self.query_entry.bind('<KeyRelease>', self.queue_suggestions)
         self.query_entry.bind('<Tab>', self.autofill_suggestion)
 
         # Execute button
@@ -116,6 +2589,20 @@ class TextEditor:
         execute_button.grid(row=0, column=2, padx=(5, 0))
 
         # Set initial directory
+        self.dir_cache = DirectoryCache()
+        self.fuzzy = FuzzyMatcher()
+        # :o searches every file under open_root, or under current_dir if unset
+        self.crawler = FileCrawler()
+        self.open_root = None
+        # Changes on disk under current_dir and the open files' directories
+        # are patched into the listing and the tabs as they happen
+        self.watcher = DirectoryWatcher(self.dir_cache)
+        self.watch_changes = []
+        self.watched_workspace = None
+        self.listed_dir = None
+        self.listed_names = []  # dir_listbox rows after '..', kept sorted
+        self.disk_changed_image = tk.PhotoImage(width=8, height=8)
+        self.disk_changed_image.put('#E5A50A', to=(0, 0, 8, 8))
         self.current_dir = os.path.expanduser('~')
         self.update_dir_listing()
         
@@ -123,6 +2610,7 @@ class TextEditor:
 
         # Create the first tab
         self.open_file("Untitled-1")
+        self.start_watching()
         
         # Maximize the window
         self.root.state('zoomed')
@@ -142,6 +2630,15 @@ class TextEditor:
         self.current_highlight_tag = 'current_highlight'
         self.case_sensitive_var = tk.BooleanVar()
         self.case_sensitive_var.set(True)
+        self.regex_var = tk.BooleanVar(value=False)
+        self.whole_word_var = tk.BooleanVar(value=False)
+        self.multiline_var = tk.BooleanVar(value=False)
+        # Regex, whole word and multiline switches given to the last :f
+        self.find_modes = (False, False, False)
+        # Search-as-you-type state for the Find and Replace window
+        self.search_generation = 0
+        self.live_search = None  # (tab, SearchIndex)
+        self.live_search_tagged = (0, 0)
         
         self.use_spaces = tk.BooleanVar(value=True)  # Default to spaces
         self.tab_width = tk.IntVar(value=4)  # Default to 4 spaces/tab width
@@ -152,6 +2649,10 @@ class TextEditor:
         self.suggestion_index = 0
         self.current_word = ""
         self.completing = False
+        self.accepted = AcceptedWords()
+
+        # Saves run one at a time, in order, off the Tk thread
+        self.save_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
         
     def open_command_prompt(self):
         subprocess.Popen(['osascript', '-e', f'tell app "Terminal" to do script "cd {self.current_dir}"'])
@@ -194,10 +2695,53 @@ class TextEditor:
         if not text_widget:
             return []
 
-        content = text_widget.get("1.0", tk.END)
-        words = re.findall(r'\b\w+\b', content)
-        unique_words = sorted(set(words))
-        return [word for word in unique_words if word.lower().startswith(prefix.lower()) and word.lower() != prefix.lower()]
+        # Candidates come from the current tab, the other open tabs and the
+        # files under current_dir; only the best few are kept for cycling
+        index = self.get_word_index(current_tab)
+        others = [self.get_word_index(self.notebook.nametowidget(tab_id)) for tab_id in self.notebook.tabs()
+                  if self.notebook.nametowidget(tab_id) is not current_tab
+                  and self.get_buffer(self.notebook.nametowidget(tab_id)) is not None]
+        candidates = dict.fromkeys(index.complete(prefix))
+        for other in others:
+            candidates.update(dict.fromkeys(other.complete(prefix)))
+        candidates.update(dict.fromkeys(self.workspace.complete(prefix, self.current_dir)))
+        if self.watched_workspace is not self.workspace.directories:
+            # A build finished since the watches were last set
+            self.update_watches()
+        workspace = self.workspace.words
+        nearby = self.nearby_words(text_widget, prefix)
+
+        def score(word):
+            distance = nearby.get(word)
+            return (2 * math.log1p(index.counts.get(word, 0))
+                    + sum(math.log1p(other.counts.get(word, 0)) for other in others)
+                    + 0.5 * math.log1p(workspace.counts.get(word, 0))
+                    + (4 / (1 + distance) if distance is not None else 0)
+                    + 6 * self.accepted.recency(word))
+
+        return heapq.nlargest(COMPLETION_TOP_K, candidates, key=score)
+
+    def nearby_words(self, text_widget, prefix):
+        # Line distance from the cursor to the closest use of each matching word
+        cursor = int(text_widget.index(tk.INSERT).split('.')[0])
+        first = max(1, cursor - COMPLETION_NEARBY_LINES)
+        text = text_widget.get(f"{first}.0", f"{cursor + COMPLETION_NEARBY_LINES}.end")
+        key = prefix.lower()
+        distances = {}
+        for offset, line in enumerate(text.split('\n')):
+            distance = abs(first + offset - cursor)
+            for word in WordIndex.WORD.findall(line):
+                if word.lower().startswith(key) and distance < distances.get(word, distance + 1):
+                    distances[word] = distance
+        return distances
+
+    def get_word_index(self, tab):
+        if self.get_buffer(tab) is None:
+            # The paged viewer has no buffer; index the loaded window instead
+            return WordIndex(self.get_text_widget(tab).get("1.0", "end-1c"))
+        if tab.words is None:
+            tab.words = WordIndex(tab.buffer.getvalue())
+        return tab.words
         
     def insert_suggestion(self):
         current_tab = self.notebook.nametowidget(self.notebook.select())
@@ -231,12 +2775,17 @@ class TextEditor:
         # Update current_word to the full suggestion for subsequent cycles
         self.current_word = suggestion
         
-    def on_key_release(self, event):
-        if event.keysym not in ('Control_L', 'Control_R'):
-            self.completing = False
-            self.current_word = ""
-            self.suggestions = []
-            self.suggestion_index = 0
+    def on_key_press(self, event):
+        # Only a key that types a character ends the completion and accepts
+        # it; Ctrl, Shift, arrows and BackSpace leave the cycle alone
+        if event.state & 0x4 or not event.char or not event.char.isprintable():
+            return
+        if self.completing and self.suggestions:
+            self.accepted.add(self.suggestions[self.suggestion_index])
+        self.completing = False
+        self.current_word = ""
+        self.suggestions = []
+        self.suggestion_index = 0
         
     def create_indent_settings(self):
         # Create a frame for indent settings
@@ -297,8 +2846,6 @@ class TextEditor:
         
         # Insert the new line with the same indentation
         text_widget.insert(tk.INSERT, f"\n{indentation}")
-        
-        self.update_line_numbers()  # Update line numbers after auto-indent
         return 'break'  # Prevent the default behavior
         
     def handle_tab(self, event):
@@ -315,9 +2862,7 @@ class TextEditor:
             selected = False
 
         if selected:
-            result = self.indent_selected_lines(text_widget, sel_start, sel_end)
-            self.update_line_numbers()  # Update line numbers after indentation
-            return result
+            return self.indent_selected_lines(text_widget, sel_start, sel_end)
         else:
             # Existing behavior for when there's no selection
             cursor_pos = text_widget.index(tk.INSERT)
@@ -326,7 +2871,6 @@ class TextEditor:
             
             if col_num == 0 or line[:col_num].isspace():
                 text_widget.insert(tk.INSERT, self.get_indent_string())
-                self.update_line_numbers()  # Update line numbers after adding indentation
                 return 'break'
             
             return None  # Allow default tab behavior elsewhere
@@ -352,7 +2896,6 @@ class TextEditor:
             line_num = int(cursor_pos.split('.')[0])
             result = self.unindent_selected_lines(text_widget, f"{line_num}.0", f"{line_num}.end")
         
-        self.update_line_numbers()  # Update line numbers after unindentation
         return result
             
     def indent_selected_lines(self, text_widget, sel_start, sel_end):
@@ -388,10 +2931,160 @@ class TextEditor:
         return 'break'
 
     def update_dir_listing(self):
-        self.dir_listbox.delete(0, tk.END)
-        self.dir_listbox.insert(tk.END, '..')
-        for item in sorted(os.listdir(self.current_dir)):
-            self.dir_listbox.insert(tk.END, item)
+        names = self.dir_cache.names(self.current_dir)
+        if self.listed_dir == self.current_dir:
+            # Same directory: only the rows that changed are touched
+            listed, current = set(self.listed_names), set(names)
+            self.apply_dir_changes(current - listed, listed - current)
+        else:
+            self.dir_listbox.delete(0, tk.END)
+            self.dir_listbox.insert(tk.END, '..', *names)
+            self.listed_dir = self.current_dir
+            self.listed_names = list(names)
+        self.update_watches()
+
+    def apply_dir_changes(self, added, removed):
+        names = self.listed_names
+        for name in removed:
+            i = bisect.bisect_left(names, name)
+            if i < len(names) and names[i] == name:
+                del names[i]
+                self.dir_listbox.delete(i + 1)
+        for name in sorted(added):
+            i = bisect.bisect_left(names, name)
+            if i == len(names) or names[i] != name:
+                names.insert(i, name)
+                self.dir_listbox.insert(i + 1, name)
+
+    def update_watches(self):
+        directories = {os.path.abspath(self.current_dir)}
+        files = []
+        for tab_id in self.notebook.tabs():
+            file_path = getattr(self.notebook.nametowidget(tab_id), 'file_path', None)
+            if file_path:
+                file_path = os.path.abspath(file_path)
+                directories.add(os.path.dirname(file_path))
+                files.append(file_path)
+        self.watched_workspace = self.workspace.directories
+        if self.watcher.fd is not None:
+            # inotify watches are cheap, so the tree behind Ctrl+N is watched
+            # too and changes anywhere in it keep the index fresh
+            directories.update(itertools.islice(self.workspace.directories, WORKSPACE_MAX_WATCHES))
+        self.watcher.watch(directories, files)
+
+    def start_watching(self):
+        if self.watcher.fd is not None and hasattr(self.root.tk, 'createfilehandler'):
+            # Tk wakes us whenever inotify has events
+            self.root.tk.createfilehandler(self.watcher.fd, tk.READABLE,
+                                           lambda fd, mask: self.read_watch_events())
+        else:
+            self.poll_watch()
+
+    def poll_watch(self):
+        self.read_watch_events()
+        self.root.after(WATCH_POLL_MS, self.poll_watch)
+
+    def read_watch_events(self):
+        changes = self.watcher.read()
+        if changes:
+            # A burst of events is applied in one pass once Tk is idle
+            self.watch_changes.extend(changes)
+            self.scheduler.schedule('watch', self.apply_watch_changes)
+
+    def apply_watch_changes(self):
+        changes, self.watch_changes = self.watch_changes, []
+        relist = set()
+        pending = {}  # directory -> {name: 'added' or 'removed'}, last event wins
+        paths = set()
+        for directory, name, kind in changes:
+            if name is None:
+                relist.add(directory)
+                continue
+            # A written file is re-stated so its cached size and mtime stay right
+            pending.setdefault(directory, {})[name] = 'removed' if kind == 'removed' else 'added'
+            paths.add(os.path.join(directory, name))
+
+        current_dir = os.path.abspath(self.current_dir)
+        for directory, names in pending.items():
+            if directory in relist:
+                continue
+            result = self.dir_cache.apply(directory, names)
+            if directory == current_dir and self.listed_dir == self.current_dir:
+                if result is None:
+                    relist.add(directory)
+                else:
+                    self.apply_dir_changes(*result)
+        for directory in relist:
+            self.dir_cache.invalidate(directory)
+        if current_dir in relist:
+            try:
+                self.update_dir_listing()
+            except OSError:
+                # current_dir itself was removed; keep the last listing
+                pass
+        elif relist:
+            self.update_watches()
+
+        for tab_id in self.notebook.tabs():
+            tab = self.notebook.nametowidget(tab_id)
+            file_path = getattr(tab, 'file_path', None)
+            if file_path:
+                file_path = os.path.abspath(file_path)
+                if file_path in paths or os.path.dirname(file_path) in relist:
+                    self.check_disk_change(tab)
+
+        # Files under the indexed directory changed; rebuild once things settle
+        if self.workspace_changed(changes):
+            self.scheduler.schedule('workspace', self.workspace.refresh, self.workspace.root,
+                                    delay=WORKSPACE_REFRESH_MS)
+
+    def workspace_changed(self, changes):
+        # Our own saves are patched into the index as they finish, so only
+        # other changes under its root count
+        tabs = {}
+        for tab_id in self.notebook.tabs():
+            tab = self.notebook.nametowidget(tab_id)
+            if getattr(tab, 'file_path', None):
+                tabs[os.path.abspath(tab.file_path)] = tab
+        for directory, name, kind in changes:
+            if not self.workspace.covers(os.path.join(directory, name or '')):
+                continue
+            if name is None:
+                return True
+            path = os.path.join(directory, name)
+            tab = tabs.get(path)
+            if tab is not None and (tab.saving or file_mtime(path) == tab.disk_mtime):
+                continue
+            # The temporary file atomic_write renames over a saved file
+            if name.startswith('.') and name.endswith('.tmp') and os.path.join(directory, name[1:].rsplit('.', 2)[0]) in tabs:
+                continue
+            return True
+        return False
+
+    def check_disk_change(self, tab):
+        # Our own saves are not outside changes
+        if getattr(tab, 'saving', False):
+            return
+        if file_mtime(tab.file_path) != getattr(tab, 'disk_mtime', None):
+            self.mark_changed_on_disk(tab, True)
+
+    def mark_changed_on_disk(self, tab, changed):
+        if getattr(tab, 'changed_on_disk', False) == changed:
+            return
+        tab.changed_on_disk = changed
+        # The title text is left alone since tabs are matched by it
+        self.notebook.tab(tab, image=self.disk_changed_image if changed else '', compound=tk.LEFT)
+
+    def reload_current_tab(self):
+        current_tab = self.notebook.nametowidget(self.notebook.select())
+        file_path = getattr(current_tab, 'file_path', None)
+        if not file_path or not os.path.isfile(file_path):
+            messagebox.showerror("Error", "The current tab has no file on disk to reload.")
+            return
+        if self.unsaved_changes.get(current_tab, False):
+            if not messagebox.askyesno("Unsaved Changes", "There are unsaved changes. Do you want to discard them and reload the file?"):
+                return
+        self.reload_tab(current_tab)
 
     def process_query(self, event=None):
         query = self.query_entry.get().strip()
@@ -408,8 +3101,8 @@ class TextEditor:
             elif command[0] == 's':
                 self.save_current_file()
             elif command[0] == 'sq':
-                self.save_current_file()
-                self.close_current_tab()
+                # Close once the background save has completed
+                self.save_current_file(on_saved=self.close_tab)
             elif command[0] == 'new' and len(command) > 1:
                 self.create_new_file(' '.join(command[1:]))
             elif command[0] == 'newd' and len(command) > 1:
@@ -425,11 +3118,45 @@ class TextEditor:
             elif command[0] == 'info' and len(command) > 1:
                 self.show_item_info(' '.join(command[1:]))
             elif command[0] == 'f' and len(command) > 1:
-                self.word_to_find = ' '.join(command[1:])
+                # Leading -r (regex), -w (whole word) and -m (multiline) switch modes
+                args = query.split()[1:]
+                modes = []
+                while len(args) > 1 and args[0].lower() in ('-r', '-w', '-m'):
+                    modes.append(args.pop(0).lower())
+                self.word_to_find = ' '.join(args)
+                self.find_modes = ('-r' in modes, '-w' in modes, '-m' in modes)
+                try:
+                    compile_search(self.word_to_find, True, *self.find_modes)
+                except re.error as e:
+                    messagebox.showerror("Error", f"Invalid regular expression '{self.word_to_find}': {str(e)}")
+                    return
                 self.current_search_position = '1.0'
                 self.highlight_occurrences()
+            elif command[0] == 'view' and len(command) > 1:
+                self.open_file(' '.join(query.split()[1:]), read_only=True)
             elif command[0] == 'fr':
                 self.find_and_replace()
+            elif command[0] == 'goto' and len(command) > 1:
+                self.goto_line(command[1])
+            elif command[0] == 'replacein' and len(command) > 1:
+                # The raw entry text, so a trailing empty replacement survives
+                self.start_replace_in_files(self.query_entry.get().split(None, 1)[1])
+            elif command[0] == 'reload':
+                self.reload_current_tab()
+            elif command[0] == 'index':
+                self.start_index()
+            elif command[0] == 'jobs':
+                self.show_jobs()
+            elif command[0] == 'o' and len(command) > 1:
+                self.open_anything(query.split(None, 1)[1])
+            elif command[0] == 'oroot':
+                self.set_open_root(query.split(None, 1)[1] if len(command) > 1 else None)
+            elif command[0] == 'grep' and len(command) > 1:
+                # The rest of the line is the pattern; -g glob limits the files
+                pattern_text, glob = query.split(None, 1)[1], None
+                if command[1] == '-g' and len(command) > 3:
+                    glob, pattern_text = pattern_text.split(None, 2)[1:]
+                self.start_grep(pattern_text, glob)
             elif command[0] == 'fs' and len(command) > 1:
                 self.change_font_size(command[1])
             elif command[0] == 'cmd':
@@ -460,7 +3187,7 @@ class TextEditor:
             for child in text_frame.winfo_children():
                 if isinstance(child, tk.Text):
                     child.configure(font=self.editor_font)
-        self.update_line_numbers()  # Ensure line numbers are updated with new font
+            self.update_line_numbers(tab_widget)  # Ensure line numbers are updated with new font
 
     def show_find_dialog(self, count):
         if self.find_window:
@@ -471,7 +3198,11 @@ class TextEditor:
         self.find_window.geometry("300x100")
         self.find_window.resizable(False, False)
         
-        label = tk.Label(self.find_window, text=f"Found {count} occurrences of '{self.word_to_find}'.")
+        if count is None:
+            label_text = f"Searching for '{self.word_to_find}' in the paged viewer."
+        else:
+            label_text = f"Found {count} occurrences of '{self.word_to_find}'."
+        label = tk.Label(self.find_window, text=label_text)
         label.pack(pady=10)
 
         find_next_button = tk.Button(self.find_window, text="Find Next", command=self.simple_find_next)
@@ -511,16 +3242,17 @@ class TextEditor:
         # Remove previous current highlight
         text_widget.tag_remove(self.current_highlight_tag, '1.0', tk.END)
 
-        start_pos = text_widget.search(self.word_to_find, self.current_search_position, stopindex=tk.END, nocase=True)
-        
-        if not start_pos:
-            start_pos = text_widget.search(self.word_to_find, '1.0', stopindex=tk.END, nocase=True)
-            if not start_pos:
-                messagebox.showinfo("Find", f"Reached the end of the document. No more occurrences of '{self.word_to_find}' found.")
-                self.current_search_position = '1.0'  # Reset to the beginning for the next search
-                return
+        if getattr(current_tab, 'paged', None):
+            self.paged_find_next(current_tab)
+            return
 
-        end_pos = f"{start_pos}+{len(self.word_to_find)}c"
+        match = self.find_next_match(current_tab, compile_search(self.word_to_find, True, *self.find_modes))
+        if match is None:
+            messagebox.showinfo("Find", f"Reached the end of the document. No more occurrences of '{self.word_to_find}' found.")
+            self.current_search_position = '1.0'  # Reset to the beginning for the next search
+            return
+
+        start_pos, end_pos = match
         
         # Highlight the current occurrence
         text_widget.tag_add(self.current_highlight_tag, start_pos, end_pos)
@@ -539,12 +3271,15 @@ class TextEditor:
         if text_widget is None:
             messagebox.showerror("Error", "No file is currently open.")
             return
+        if getattr(current_tab, 'paged', None):
+            messagebox.showerror("Error", "Find and Replace is not available in the read-only paged viewer. Use :f instead.")
+            return
 
         # Create a new top-level window if it doesn't exist
         if not self.find_replace_window or not self.find_replace_window.winfo_exists():
             self.find_replace_window = tk.Toplevel(self.root)
             self.find_replace_window.title("Find and Replace")
-            self.find_replace_window.geometry("600x200")
+            self.find_replace_window.geometry("600x240")
 
             # Find entry
             tk.Label(self.find_replace_window, text="Find:").grid(row=0, column=0, padx=5, pady=5, sticky="e")
@@ -563,6 +3298,18 @@ class TextEditor:
                                                           command=self.highlight_all_occurrences)
             self.case_sensitive_checkbox.grid(row=2, column=0, columnspan=2, pady=5)
 
+            # Search modes
+            mode_frame = tk.Frame(self.find_replace_window)
+            mode_frame.grid(row=4, column=0, columnspan=3, pady=5)
+            for text, variable in (("Regex", self.regex_var), ("Whole word", self.whole_word_var),
+                                   ("Multiline", self.multiline_var)):
+                tk.Checkbutton(mode_frame, text=text, variable=variable,
+                               command=self.highlight_all_occurrences).pack(side=tk.LEFT, padx=5)
+
+            # Match count, filled in once the background scan finishes
+            self.search_count_label = tk.Label(self.find_replace_window, text="")
+            self.search_count_label.grid(row=2, column=2, padx=5, pady=5)
+
             # Buttons
             tk.Button(self.find_replace_window, text="Find Next", command=self.advanced_find_next).grid(row=3, column=0, padx=5, pady=5)
             tk.Button(self.find_replace_window, text="Replace", command=self.replace).grid(row=3, column=1, padx=5, pady=5)
@@ -572,14 +3319,17 @@ class TextEditor:
             self.find_replace_window.protocol("WM_DELETE_WINDOW", self.on_find_replace_close)
 
     def highlight_all_occurrences(self, event=None):
+        self.search_generation += 1
+        self.live_search = None
         current_tab = self.notebook.nametowidget(self.notebook.select())
         text_widget = self.get_text_widget(current_tab)
-        if not text_widget:
+        if not text_widget or self.get_buffer(current_tab) is None:
             return
 
         find_text = self.find_entry.get()
         if not find_text:
             self.clear_all_highlights(text_widget)
+            self.search_count_label.config(text="")
             return
 
         # Remove any existing highlights
@@ -589,46 +3339,98 @@ class TextEditor:
         text_widget.tag_configure(self.highlight_tag, background='yellow', foreground='black')
         text_widget.tag_configure(self.current_highlight_tag, background='orange', foreground='black')
 
-        # Find and highlight all occurrences
-        start_pos = '1.0'
-        while True:
-            start_pos = text_widget.search(find_text, start_pos, stopindex=tk.END, 
-                                           nocase=not self.case_sensitive_var.get())
-            if not start_pos:
-                break
-            end_pos = f"{start_pos}+{len(find_text)}c"
-            text_widget.tag_add(self.highlight_tag, start_pos, end_pos)
-            start_pos = end_pos
-
         self.current_search_position = '1.0'
         self.word_to_find = find_text
+
+        # Scan in time slices so the entry stays responsive; the next
+        # keystroke bumps the generation and the old scan stops
+        try:
+            pattern = self.replace_window_pattern(find_text, report=False)
+        except re.error:
+            # Most likely a regex that is still being typed
+            self.search_count_label.config(text="Invalid pattern")
+            return
+        if current_tab.search is None or not current_tab.search.matches(pattern, current_tab.buffer):
+            current_tab.search = SearchIndex(current_tab.buffer, pattern)
+        self.live_search = (current_tab, current_tab.search)
+        self.live_search_tagged = (0, 0)
+        self.search_count_label.config(text="Searching...")
+        self.scan_live_search(self.search_generation)
+
+    def scan_live_search(self, generation):
+        if generation != self.search_generation or self.live_search is None:
+            return
+        tab, search = self.live_search
+        if str(tab) not in self.notebook.tabs():
+            return
+        if not search.matches(search.pattern, tab.buffer):
+            # The text changed under the scan; start over on the new text
+            search = tab.search = SearchIndex(tab.buffer, search.pattern)
+            self.live_search = (tab, search)
+            self.clear_all_highlights(tab.text_area)
+            self.live_search_tagged = (0, 0)
+        done = search.scan(time.monotonic() + STREAM_BATCH_SECONDS)
+        self.highlight_visible_matches(tab)
+        if not done:
+            self.root.after(1, self.scan_live_search, generation)
+            return
+        if self.find_replace_window:
+            self.search_count_label.config(text=f"{len(search)} matches")
         self.advanced_find_next()
 
+    def highlight_visible_matches(self, tab):
+        # Tag only the matches around the viewport; scrolling tags more
+        if self.live_search is None or self.live_search[0] is not tab:
+            return
+        search = self.live_search[1]
+        if not search.matches(search.pattern, tab.buffer):
+            return
+        text_widget = tab.text_area
+        first = int(text_widget.index('@0,0').split('.')[0])
+        last = int(text_widget.index(f"@0,{text_widget.winfo_height()}").split('.')[0])
+        start = tab.buffer.offset_of(max(1, first - SEARCH_VIEW_MARGIN))
+        end = tab.buffer.offset_of(last + SEARCH_VIEW_MARGIN + 1)
+        lo = bisect.bisect_left(search.starts, start)
+        hi = bisect.bisect_left(search.starts, end)
+        tagged_lo, tagged_hi = self.live_search_tagged
+        if hi < tagged_lo or lo > tagged_hi:
+            spans = [(lo, hi)]
+            self.live_search_tagged = (lo, hi)
+        else:
+            # Skip the run of matches that is already tagged
+            spans = [(lo, tagged_lo), (tagged_hi, hi)]
+            self.live_search_tagged = (min(lo, tagged_lo), max(hi, tagged_hi))
+        for span_lo, span_hi in spans:
+            if span_lo < span_hi:
+                text_widget.tag_add(self.highlight_tag, *search.tk_ranges(span_lo, span_hi))
+
     def advanced_find_next(self):
         current_tab = self.notebook.nametowidget(self.notebook.select())
         text_widget = self.get_text_widget(current_tab)
         if text_widget is None:
             messagebox.showerror("Error", "Cannot find text widget in the current tab.")
             return
+        if self.get_buffer(current_tab) is None:
+            # The paged viewer has no buffer to search or edit; :f works there
+            self.search_count_label.config(text="Not available here; use :f")
+            return
 
         # Remove previous current highlight
         text_widget.tag_remove(self.current_highlight_tag, '1.0', tk.END)
 
-        start_pos = text_widget.search(self.word_to_find, self.current_search_position, 
-                                       stopindex=tk.END, nocase=not self.case_sensitive_var.get())
-        
-        if not start_pos:
-            start_pos = text_widget.search(self.word_to_find, '1.0', 
-                                           stopindex=tk.END, nocase=not self.case_sensitive_var.get())
-            if not start_pos:
-                messagebox.showinfo("Find", f"Reached the end of the document. No more occurrences of '{self.word_to_find}' found.")
-                self.current_search_position = '1.0'  # Reset to the beginning for the next search
-                if self.find_replace_window:
-                    self.find_replace_window.focus_force()
-                    self.find_entry.focus_set()
-                return
+        pattern = self.replace_window_pattern(self.word_to_find)
+        if pattern is None:
+            return
+        match = self.find_next_match(current_tab, pattern)
+        if match is None:
+            messagebox.showinfo("Find", f"Reached the end of the document. No more occurrences of '{self.word_to_find}' found.")
+            self.current_search_position = '1.0'  # Reset to the beginning for the next search
+            if self.find_replace_window:
+                self.find_replace_window.focus_force()
+                self.find_entry.focus_set()
+            return
 
-        end_pos = f"{start_pos}+{len(self.word_to_find)}c"
+        start_pos, end_pos = match
         
         # Highlight the current occurrence
         text_widget.tag_add(self.current_highlight_tag, start_pos, end_pos)
@@ -647,6 +3449,10 @@ class TextEditor:
         text_widget = self.get_text_widget(current_tab)
         if text_widget is None:
             return
+        if self.get_buffer(current_tab) is None:
+            # The paged viewer has no buffer to search or edit; :f works there
+            self.search_count_label.config(text="Not available here; use :f")
+            return
 
         replace_text = self.replace_entry.get()
 
@@ -654,6 +3460,14 @@ class TextEditor:
         ranges = text_widget.tag_ranges(self.current_highlight_tag)
         if ranges:
             start, end = ranges[0], ranges[1]
+            if self.regex_var.get():
+                pattern = self.replace_window_pattern(self.word_to_find)
+                match = pattern.fullmatch(text_widget.get(start, end)) if pattern is not None else None
+                try:
+                    replace_text = match.expand(replace_text) if match else replace_text
+                except re.error as e:
+                    messagebox.showerror("Error", f"Invalid replacement '{replace_text}': {str(e)}")
+                    return
             text_widget.delete(start, end)
             text_widget.insert(start, replace_text)
             
@@ -676,24 +3490,71 @@ class TextEditor:
                 self.find_replace_window.focus_force()
                 self.find_entry.focus_set()
 
+    def replace_window_pattern(self, term, report=True):
+        try:
+            return compile_search(term, not self.case_sensitive_var.get(), self.regex_var.get(),
+                                  self.whole_word_var.get(), self.multiline_var.get())
+        except re.error as e:
+            if not report:
+                raise
+            messagebox.showerror("Error", f"Invalid regular expression '{term}': {str(e)}")
+            return None
+
     def replace_all(self):
         current_tab = self.notebook.nametowidget(self.notebook.select())
         text_widget = self.get_text_widget(current_tab)
         if text_widget is None:
             return
+        if self.get_buffer(current_tab) is None:
+            # The paged viewer has no buffer to search or edit; :f works there
+            self.search_count_label.config(text="Not available here; use :f")
+            return
 
         find_text = self.find_entry.get()
         replace_text = self.replace_entry.get()
 
-        content = text_widget.get('1.0', tk.END)
-        if self.case_sensitive_var.get():
-            new_content, count = re.subn(re.escape(find_text), replace_text, content)
-        else:
-            new_content, count = re.subn(re.escape(find_text), replace_text, content, flags=re.IGNORECASE)
+        pattern = self.replace_window_pattern(find_text)
+        if pattern is None:
+            return
+        if getattr(current_tab, 'loader', None):
+            messagebox.showerror("Error", "The file is still loading.")
+            return
+        buffer = self.get_buffer(current_tab)
+        content = buffer.getvalue()
+        # Regex mode expands \1 and \g<name> in the replacement; otherwise it is literal
+        regex = self.regex_var.get()
+        offsets = []
+        parts = []
+        position = 0
+        try:
+            for match in pattern.finditer(content):
+                replacement = match.expand(replace_text) if regex else replace_text
+                offsets.append(match.start())
+                offsets.append(match.end())
+                parts.append(content[position:match.start()])
+                parts.append(replacement)
+                position = match.end()
+        except re.error as e:
+            messagebox.showerror("Error", f"Invalid replacement '{replace_text}': {str(e)}")
+            return
+        parts.append(content[position:])
+        count = len(offsets) // 2
         
         if count > 0:
-            text_widget.delete('1.0', tk.END)
-            text_widget.insert('1.0', new_content)
+            # Only the matched ranges change, from the end backwards so earlier
+            # indices stay valid, which keeps the cursor, tags and scroll position
+            indices = tk_indices(line_start_table(content), offsets, content)
+            edits = []
+            for i in range(count - 1, -1, -1):
+                edits.extend((indices[2 * i], indices[2 * i + 1], parts[2 * i + 1]))
+            self.root.tk.call('texnav_replace_ranges', current_tab.widget_cmd, edits)
+            # The edits bypassed text_proxy, so bring the buffer up to date here
+            new_content = ''.join(parts)
+            buffer.reset(new_content)
+            if current_tab.words is not None:
+                current_tab.words.reset(new_content)
+            self.queue_line_numbers(current_tab)
+            self.on_text_change()
             self.clear_all_highlights(text_widget)
             messagebox.showinfo("Replace All", f"Replaced {count} occurrence(s).")
         else:
@@ -704,6 +3565,8 @@ class TextEditor:
             self.find_entry.focus_set()
 
     def on_find_replace_close(self):
+        self.search_generation += 1
+        self.live_search = None
         current_tab = self.notebook.nametowidget(self.notebook.select())
         text_widget = self.get_text_widget(current_tab)
         if text_widget:
@@ -736,16 +3599,17 @@ class TextEditor:
         text_widget.tag_configure(self.highlight_tag, background='yellow', foreground='black')
         text_widget.tag_configure(self.current_highlight_tag, background='orange', foreground='black')
 
-        count = 0
-        start_pos = '1.0'
-        while True:
-            start_pos = text_widget.search(self.word_to_find, start_pos, stopindex=tk.END, nocase=True)
-            if not start_pos:
-                break
-            end_pos = f"{start_pos}+{len(self.word_to_find)}c"
-            text_widget.tag_add(self.highlight_tag, start_pos, end_pos)
-            count += 1
-            start_pos = end_pos
+        if getattr(current_tab, 'paged', None):
+            # Counting would mean scanning the whole file, so just step through matches
+            current_tab.paged_match = None
+            self.show_find_dialog(None)
+            self.simple_find_next()
+            return
+
+        search = self.search_buffer(current_tab, compile_search(self.word_to_find, True, *self.find_modes))
+        count = len(search)
+        if count:
+            text_widget.tag_add(self.highlight_tag, *search.tk_ranges())
 
         if count > 0:
             self.current_search_position = '1.0'  # Reset search position
@@ -756,6 +3620,58 @@ class TextEditor:
 
 
 
+    def search_buffer(self, tab, pattern):
+        # Reuse the match index until the pattern or the buffer changes
+        search = tab.search
+        if search is None or not search.matches(pattern, tab.buffer):
+            search = tab.search = SearchIndex(tab.buffer, pattern)
+        # Finish a pass that search-as-you-type left part way through
+        search.scan()
+        return search
+
+    def find_next_match(self, tab, pattern):
+        # Start and end index of the first match at or after current_search_position
+        search = self.search_buffer(tab, pattern)
+        line, col = self.tk_index(tab.widget_cmd, self.current_search_position)
+        i = search.next_match(tab.buffer.offset_of(line, col))
+        if i is None:
+            return None
+        return search.tk_index(search.starts[i]), search.tk_index(search.ends[i])
+
+    def paged_find_next(self, tab):
+        paged = tab.paged
+        try:
+            pattern = compile_bytes_search(compile_search(self.word_to_find, True, *self.find_modes), paged.encoding)
+        except (ValueError, re.error) as e:
+            messagebox.showerror("Error", f"Cannot search this file for '{self.word_to_find}': {str(e)}")
+            return
+        start = getattr(tab, 'paged_match', None) or 0
+
+        match = paged.find(pattern, start)
+        if match is None and start:
+            match = paged.find(pattern, 0)
+        if match is None:
+            messagebox.showinfo("Find", f"Reached the end of the document. No more occurrences of '{self.word_to_find}' found.")
+            tab.paged_match = None
+            return
+
+        line, line_start, match_start, match_end = match
+        if line >= paged.line_count():
+            messagebox.showinfo("Find", "The next match is past the part of the file indexed so far. Try again in a moment.")
+            return
+        tab.paged_match = max(match_end, match_start + 1)
+
+        # Page the match into view and convert its byte span to characters
+        self.load_paged_window(tab, line)
+        char_col, char_len = paged.match_span(line_start, match_start, match_end)
+        start_pos = f"{line - tab.view_first + 1}.{char_col}"
+        end_pos = f"{start_pos}+{char_len}c"
+        tab.text_area.tag_add(self.current_highlight_tag, start_pos, end_pos)
+        tab.text_area.see(start_pos)
+
+        if self.find_window:
+            self.find_window.focus_force()
+
     def show_item_info(self, item_name):
         item_path = os.path.join(self.current_dir, item_name)
         if not os.path.exists(item_path):
@@ -808,19 +3724,7 @@ class TextEditor:
             messagebox.showerror("Error", f"The destination '{destination}' already exists.")
             return
 
-        try:
-            if os.path.isfile(source_path):
-                os.makedirs(os.path.dirname(dest_path), exist_ok=True)
-                shutil.copy2(source_path, dest_path)
-                messagebox.showinfo("Success", f"File '{source}' has been copied to '{destination}'.")
-            elif os.path.isdir(source_path):
-                shutil.copytree(source_path, dest_path)
-                messagebox.showinfo("Success", f"Directory '{source}' and its contents have been copied to '{destination}'.")
-
-            self.update_dir_listing()
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to copy '{source}' to '{destination}': {str(e)}")
+        self.submit_job(Job('copy', source_path, dest_path))
 
     def move_item(self, command):
         try:
@@ -842,33 +3746,111 @@ class TextEditor:
             messagebox.showerror("Error", f"The destination '{destination}' is not a directory.")
             return
 
-        try:
-            # If destination is a directory, we want to move the source into it
-            if os.path.isdir(dest_path):
-                dest_path = os.path.join(dest_path, os.path.basename(source_path))
-            
-            # Create the destination directory if it doesn't exist
-            os.makedirs(os.path.dirname(dest_path), exist_ok=True)
-            
-            # Perform the move operation
-            shutil.move(source_path, dest_path)
-            
-            messagebox.showinfo("Success", f"'{source}' has been moved to '{destination}'.")
-            
-            # Update any open tabs if the moved file is currently open
-            for tab in self.notebook.tabs():
-                if self.notebook.tab(tab, "text") == os.path.basename(source_path):
-                    self.notebook.tab(tab, text=os.path.basename(dest_path))
-                    # Update the file path in the text widget if you're storing it
-                    text_widget = self.notebook.nametowidget(tab).winfo_children()[0]
-                    if hasattr(text_widget, 'file_path'):
-                        text_widget.file_path = dest_path
-                    break
-            
+        # If destination is a directory, we want to move the source into it
+        if os.path.isdir(dest_path):
+            dest_path = os.path.join(dest_path, os.path.basename(source_path))
+        if os.path.exists(dest_path):
+            messagebox.showerror("Error", f"'{os.path.basename(dest_path)}' already exists in '{destination}'.")
+            return
+
+        self.submit_job(Job('move', source_path, dest_path))
+
+    def on_close(self):
+        # Closing cancels running jobs, which can leave a move or delete half done
+        active = self.jobs.active()
+        if active and not messagebox.askyesno("Jobs Running", f"{len(active)} copy, move or delete job(s) are still running. "
+                                              "Closing cancels them and can leave a move or delete half done. Close anyway?"):
+            self.show_jobs()
+            return
+        self.root.destroy()
+
+    def submit_job(self, job):
+        # The work runs on a job thread; poll_jobs reports it as it goes
+        self.jobs.submit(job)
+        self.show_jobs()
+        if not self.jobs_polling:
+            self.jobs_polling = True
+            self.root.after(JOB_POLL_MS, self.poll_jobs)
+
+    def show_jobs(self):
+        if self.jobs_window is None or not self.jobs_window.winfo_exists():
+            self.jobs_window = tk.Toplevel(self.root)
+            self.jobs_window.title("Jobs")
+            self.jobs_window.geometry("700x200")
+            self.jobs_window.configure(bg=self.bg_color)
+            self.jobs_window.columnconfigure(0, weight=1)
+            self.jobs_window.rowconfigure(0, weight=1)
+
+            self.jobs_listbox = tk.Listbox(self.jobs_window, bg=self.bg_color, fg=self.fg_color,
+                                           font=('Courier', 10), activestyle='none')
+            self.jobs_listbox.grid(row=0, column=0, sticky="nsew")
+            jobs_scrollbar = ttk.Scrollbar(self.jobs_window, orient="vertical", command=self.jobs_listbox.yview)
+            jobs_scrollbar.grid(row=0, column=1, sticky="ns")
+            self.jobs_listbox.config(yscrollcommand=jobs_scrollbar.set)
+
+            button_frame = tk.Frame(self.jobs_window, bg=self.bg_color)
+            button_frame.grid(row=1, column=0, columnspan=2, sticky="ew", padx=5, pady=5)
+            tk.Button(button_frame, text="Cancel", command=self.cancel_selected_job).pack(side=tk.LEFT)
+            tk.Button(button_frame, text="Clear Finished", command=self.clear_finished_jobs).pack(side=tk.LEFT, padx=5)
+            self.jobs_window.bind('<Escape>', lambda e: self.jobs_window.destroy())
+        self.update_jobs_panel()
+
+    def update_jobs_panel(self):
+        if self.jobs_window is None or not self.jobs_window.winfo_exists():
+            return
+        rows = []
+        for job in self.jobs.jobs:
+            name = os.path.basename(job.source)
+            target = f" -> {job.destination}" if job.destination else ""
+            progress = f"{job.files_done}/{job.files_total} files"
+            if job.bytes_total:
+                progress += f", {format_size(job.bytes_done)} of {format_size(job.bytes_total)}"
+            rows.append(f"{job.kind} {name}{target}: {job.state}, {progress}")
+        selection = self.jobs_listbox.curselection()
+        self.jobs_listbox.delete(0, tk.END)
+        self.jobs_listbox.insert(tk.END, *rows)
+        if selection and selection[0] < len(rows):
+            self.jobs_listbox.selection_set(selection[0])
+
+    def poll_jobs(self):
+        finished = [job for job in self.jobs.jobs if job.finished() and not job.reported]
+        for job in finished:
+            job.reported = True
+            if job.state == 'failed':
+                messagebox.showerror("Error", f"Failed to {job.kind} '{os.path.basename(job.source)}': {str(job.error)}")
+            elif job.state == 'done' and job.kind == 'move':
+                self.retarget_tabs(job.source, job.destination)
+        if finished:
+            # One refresh per batch of finished jobs
             self.update_dir_listing()
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to move '{source}' to '{destination}': {str(e)}")
+        self.update_jobs_panel()
+        if self.jobs.active():
+            self.root.after(JOB_POLL_MS, self.poll_jobs)
+        else:
+            self.jobs_polling = False
+
+    def cancel_selected_job(self):
+        selection = self.jobs_listbox.curselection()
+        if selection and selection[0] < len(self.jobs.jobs):
+            self.jobs.jobs[selection[0]].cancel()
+
+    def clear_finished_jobs(self):
+        self.jobs.jobs = [job for job in self.jobs.jobs if not job.finished() or not job.reported]
+        self.update_jobs_panel()
+
+    def retarget_tabs(self, source, destination):
+        # Open tabs follow their files to where they were moved
+        for tab_id in self.notebook.tabs():
+            tab = self.notebook.nametowidget(tab_id)
+            file_path = getattr(tab, 'file_path', None)
+            if not file_path:
+                continue
+            file_path = os.path.abspath(file_path)
+            if file_path == source or file_path.startswith(source + os.sep):
+                tab.file_path = destination + file_path[len(source):]
+                title = os.path.basename(tab.file_path)
+                self.notebook.tab(tab, text=title + ('*' if self.unsaved_changes.get(tab, False) else ''))
+        self.update_watches()
 
     def rename_item(self, command):
         try:
@@ -912,16 +3894,7 @@ class TextEditor:
 
         confirm = messagebox.askyesno("Confirm Deletion", f"Are you sure you want to delete '{item_name}'?")
         if confirm:
-            try:
-                if os.path.isfile(item_path):
-                    os.remove(item_path)
-                    messagebox.showinfo("Success", f"File '{item_name}' has been deleted.")
-                elif os.path.isdir(item_path):
-                    shutil.rmtree(item_path)
-                    messagebox.showinfo("Success", f"Directory '{item_name}' and its contents have been deleted.")
-                self.update_dir_listing()
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to delete '{item_name}': {str(e)}")
+            self.submit_job(Job('delete', os.path.abspath(item_path)))
 
     def navigate_or_open(self, path):
         if path == '..':
@@ -945,8 +3918,21 @@ class TextEditor:
             os.mkdir(dir_path)
             self.update_dir_listing()
 
-    def open_file(self, file_name):
+    def open_file(self, file_name, read_only=False, title=None):
         file_path = os.path.join(self.current_dir, file_name)
+        title = title or file_name
+        if read_only and not os.path.isfile(file_path):
+            messagebox.showerror("Error", f"The file '{file_name}' does not exist.")
+            return
+        if read_only:
+            # The paged viewer reads UTF-8 and Latin-1 only
+            try:
+                kind, encoding = sniff_file(file_path)
+            except OSError:
+                kind, encoding = None, None
+            if kind == 'text' and encoding not in PAGED_ENCODINGS:
+                messagebox.showerror("Error", f"'{file_name}' is {encoding.upper()}, which the read-only viewer cannot show. Open it without :view instead.")
+                return
         
         # Check if the file is already open in a tab
         for tab in self.notebook.tabs():
@@ -964,7 +3950,7 @@ class TextEditor:
                     if tab_path == file_path:
                         self.notebook.select(tab)
                         return
-            elif tab_text == file_name:
+            elif tab_text == title:
                 self.notebook.select(tab)
                 return
 
@@ -979,10 +3965,9 @@ class TextEditor:
         text_frame.grid_columnconfigure(1, weight=1)
         text_frame.grid_rowconfigure(0, weight=1)
 
-        # Create a text widget for line numbers
-        line_numbers = tk.Text(text_frame, width=4, padx=4, takefocus=0, border=0,
-                               background=self.bg_color, foreground='gray',
-                               state='disabled', wrap='none', font=self.editor_font)
+        # Create a canvas for line numbers; only the visible lines are drawn
+        line_numbers = tk.Canvas(text_frame, width=0, takefocus=0, borderwidth=0,
+                                 highlightthickness=0, background=self.bg_color)
         line_numbers.grid(row=0, column=0, sticky="nsew")
 
         # Create the main text widget
@@ -994,7 +3979,7 @@ class TextEditor:
         # Create vertical scrollbar for text widget
         v_scrollbar = ttk.Scrollbar(text_frame, orient="vertical", command=self.on_scrollbar_y)
         v_scrollbar.grid(row=0, column=2, sticky="ns")
-        text_area.config(yscrollcommand=v_scrollbar.set)
+        text_area.config(yscrollcommand=lambda first, last: self.on_text_scroll(tab, first, last))
 
         # Create horizontal scrollbar for text widget
         h_scrollbar = ttk.Scrollbar(tab, orient="horizontal", command=text_area.xview)
@@ -1002,19 +3987,46 @@ class TextEditor:
         text_area.config(xscrollcommand=h_scrollbar.set)
 
         # If the file exists, read its contents
+        content = ''
+        encoding = None
+        paged = None
+        loader = None
         if os.path.exists(file_path):
             try:
-                with open(file_path, 'r') as file:
-                    content = file.read()
+                # Look at the first few KB before deciding how to load the file
+                kind, encoding = sniff_file(file_path)
+                size = os.path.getsize(file_path)
+                if kind == 'binary':
+                    paged = HexFile(file_path)
+                elif (read_only or size >= PAGED_VIEW_THRESHOLD) and encoding in PAGED_ENCODINGS:
+                    # Huge files are mapped and paged in around the viewport instead
+                    paged = PagedFile(file_path, encoding)
+                elif size >= STREAM_LOAD_THRESHOLD:
+                    # Large files stream in without blocking the main loop
+                    loader = FileLoader(file_path, encoding)
+                else:
+                    try:
+                        with open(file_path, 'r', encoding=encoding) as file:
+                            content = file.read()
+                    except UnicodeDecodeError:
+                        # Invalid bytes past the sniffed sample; Latin-1 reads
+                        # anything and writes the same bytes back on save
+                        encoding = 'latin-1'
+                        with open(file_path, 'r', encoding=encoding) as file:
+                            content = file.read()
                     text_area.insert(tk.END, content)
             except:
                 messagebox.showerror("Error", f"Error reading file.")
                 return
             else:
                 pass
+
+        # The piece table holds the text; the widget is kept in sync as a view
+        if paged is None:
+            self.attach_buffer(tab, text_area, content)
         
         # Add the tab to the notebook
-        self.notebook.add(tab, text=file_name)
+        self.notebook.add(tab, text=title)
     
         # Initialize saved state
         self.unsaved_changes[tab] = False
@@ -1023,6 +4035,15 @@ class TextEditor:
         tab.file_path = file_path
         tab.text_area = text_area
         tab.line_numbers = line_numbers
+        tab.v_scrollbar = v_scrollbar
+        tab.paged = None
+        tab.loader = None
+        tab.encoding = encoding
+        # What the file looked like on disk when we last read or wrote it
+        tab.disk_mtime = file_mtime(file_path)
+        tab.changed_on_disk = False
+        tab.saving = False
+        self.update_watches()
 
         # Switch to the new tab
         self.notebook.select(tab)
@@ -1033,32 +4054,654 @@ class TextEditor:
         
         # Bind events
         text_area.bind('<KeyRelease>', self.on_text_change)
+        text_area.bind('<KeyPress>', self.on_key_press, add='+')
         text_area.bind('<Return>', lambda e: self.auto_indent(e))
         text_area.bind('<Tab>', self.handle_tab)
         text_area.bind('<Shift-Tab>', self.handle_shift_tab)
         text_area.bind('<Control-n>', self.handle_autocomplete)
         text_area.bind('<<Change>>', self.on_text_change)
-        text_area.bind('<Configure>', self.on_text_change)
+        text_area.bind('<Configure>', lambda e: self.queue_line_numbers(tab))
 
-        self.update_line_numbers()
+        if paged is not None:
+            self.start_paged_view(tab, paged)
+            return
+        if loader is not None:
+            self.start_file_load(tab, loader)
+            return
+
+        self.queue_line_numbers(tab)
 
         # Ensure the text widget is editable
         text_area.config(state=tk.NORMAL)
+        self.enable_undo(text_area)
+
+    def enable_undo(self, text_area):
+        # Turned on once the file is in, so loading it is not an undoable edit
+        text_area.config(undo=True, autoseparators=True, maxundo=-1)
+        text_area.edit_reset()
+
+    def start_file_load(self, tab, loader):
+        tab.loader = loader
+        tab.load_title = self.notebook.tab(tab, "text")
+        tab.text_area.config(state=tk.DISABLED)
+        tab.text_area.bind('<Escape>', lambda e: self.cancel_file_load(tab))
+        threading.Thread(target=loader.run, daemon=True).start()
+        self.pump_file_load(tab)
+
+    def pump_file_load(self, tab):
+        loader = getattr(tab, 'loader', None)
+        if loader is None:
+            return
+        text_area = tab.text_area
+        finished = False
+        deadline = time.monotonic() + STREAM_BATCH_SECONDS
+
+        # Insert whatever arrived within the time budget, then yield to Tk
+        text_area.config(state=tk.NORMAL)
+        while time.monotonic() < deadline:
+            try:
+                chunk = loader.queue.get_nowait()
+            except queue.Empty:
+                break
+            if chunk is None:
+                finished = True
+                break
+            if chunk is FileLoader.RESTART:
+                text_area.delete('1.0', tk.END)
+                tab.encoding = loader.encoding
+                continue
+            text_area.insert(tk.END, chunk)
+        text_area.config(state=tk.DISABLED)
+
+        if finished:
+            self.finish_file_load(tab)
+        else:
+            self.notebook.tab(tab, text=f"{tab.load_title} [{loader.progress()}%]")
+            self.root.after(10, self.pump_file_load, tab)
+
+    def finish_file_load(self, tab):
+        loader = tab.loader
+        self.stop_file_load(tab)
+        if loader.error is not None:
+            messagebox.showerror("Error", f"Error reading file: {loader.error}")
+            self.notebook.select(tab)
+            self.close_current_tab()
+            return
+        self.enable_undo(tab.text_area)
+        self.queue_line_numbers(tab)
+
+    def stop_file_load(self, tab):
+        loader = getattr(tab, 'loader', None)
+        if loader is None:
+            return
+        loader.cancel()
+        tab.loader = None
+        tab.text_area.unbind('<Escape>')
+        tab.text_area.config(state=tk.NORMAL)
+        self.notebook.tab(tab, text=tab.load_title)
+
+    def cancel_file_load(self, tab):
+        self.notebook.select(tab)
+        self.close_current_tab()
+        return 'break'
+
+    def attach_buffer(self, tab, text_area, content=''):
+        tab.buffer = PieceTable(content)
+        # Built on the first Ctrl+N, then kept current edit by edit
+        tab.words = None
+        # Matches of the last search, rebuilt once the buffer changes
+        tab.search = None
+
+        # Route the widget's Tcl command through text_proxy so every edit,
+        # whether from our code or from Tk's own bindings, reaches the buffer
+        widget_cmd = str(text_area)
+        tab.widget_cmd = widget_cmd + '_orig'
+        self.root.tk.call('rename', widget_cmd, tab.widget_cmd)
+        self.root.tk.createcommand(widget_cmd, lambda *args: self.text_proxy(tab, *args))
+
+    def text_proxy(self, tab, *args):
+        call = self.root.tk.call
+        orig = tab.widget_cmd
+        if not args or args[0] not in ('insert', 'delete', 'replace', 'edit'):
+            return call((orig,) + args)
+        if args[0] == 'edit':
+            result = call((orig,) + args)
+            if len(args) > 1 and args[1] in ('undo', 'redo'):
+                tab.buffer.reset(call(orig, 'get', '1.0', 'end-1c'))
+                if tab.words is not None:
+                    tab.words.reset(tab.buffer.getvalue())
+                self.queue_line_numbers(tab)
+            return result
+        if str(call(orig, 'cget', '-state')) == tk.DISABLED:
+            return call((orig,) + args)
+
+        buffer = tab.buffer
+        words = tab.words
+        line_count = buffer.line_count()
+        if args[0] == 'insert' and len(args) >= 3:
+            line, col = self.tk_index(orig, args[1])
+            offset = buffer.offset_of(line, col) if line <= buffer.line_count() else len(buffer)
+            text = ''.join(args[2::2])
+            first = buffer.line_of(offset)
+            old_lines = buffer.get_lines(first, first) if words is not None else ''
+            result = call((orig,) + args)
+            buffer.insert(offset, text)
+            last = first + text.count('\n')
+        elif args[0] == 'delete' and len(args) in (2, 3):
+            start, end, _ = self.tk_delete_range(orig, buffer, args[1], args[2] if len(args) == 3 else None)
+            first = buffer.line_of(start)
+            old_lines = buffer.get_lines(first, buffer.line_of(end)) if words is not None else ''
+            result = call((orig,) + args)
+            buffer.delete(start, end)
+            last = first
+        elif args[0] == 'replace' and len(args) >= 4:
+            start, end, (line, col) = self.tk_delete_range(orig, buffer, args[1], args[2])
+            first = buffer.line_of(start)
+            old_lines = buffer.get_lines(first, buffer.line_of(end)) if words is not None else ''
+            result = call((orig,) + args)
+            buffer.delete(start, end)
+            offset = buffer.offset_of(line, col) if line <= buffer.line_count() else len(buffer)
+            text = ''.join(args[3::2])
+            buffer.insert(offset, text)
+            last = buffer.line_of(offset + len(text))
+        else:
+            result = call((orig,) + args)
+            buffer.reset(call(orig, 'get', '1.0', 'end-1c'))
+            if words is not None:
+                words.reset(buffer.getvalue())
+            words = None
+        if words is not None:
+            # Re-count only the lines this edit touched
+            words.remove_text(old_lines)
+            words.add_text(buffer.get_lines(first, last))
+        # The gutter only changes here when lines were added or removed
+        if buffer.line_count() != line_count:
+            self.queue_line_numbers(tab)
+        return result
+
+    def tk_index(self, widget_cmd, index):
+        # line.col of index, with col counted in code points like the buffer
+        line, col = str(self.root.tk.call(widget_cmd, 'index', index)).split('.')
+        if ASTRAL is not None and col != '0':
+            return int(line), len(self.root.tk.call(widget_cmd, 'get', f"{line}.0", f"{line}.{col}"))
+        return int(line), int(col)
+
+    def tk_delete_range(self, widget_cmd, buffer, index1, index2=None):
+        # Mirror Tk's deletion rules, including the final newline that is
+        # never deleted: a range ending on the dummy last line is pulled back
+        # one character, and so is a start at the beginning of a line.
+        last_line = buffer.line_count()
+        line1, col1 = self.tk_index(widget_cmd, index1)
+        start = buffer.offset_of(line1, col1) if line1 <= last_line else len(buffer) + 1
+        if index2 is None:
+            end = start + 1
+            line2 = last_line + 1 if end > len(buffer) else line1
+        else:
+            line2, col2 = self.tk_index(widget_cmd, index2)
+            end = buffer.offset_of(line2, col2) if line2 <= last_line else len(buffer) + 1
+        if line2 > last_line:
+            end -= 1
+            if col1 == 0 and line1 > 1:
+                start -= 1
+        return min(start, len(buffer)), min(end, len(buffer)), (line1, col1)
+
+    def check_buffer(self, tab):
+        # What is saved comes from the buffer, so make sure it still holds
+        # exactly what the widget shows before writing it out
+        text = self.root.tk.call(tab.widget_cmd, 'get', '1.0', 'end-1c')
+        if text != tab.buffer.getvalue():
+            tab.buffer.reset(text)
+            if tab.words is not None:
+                tab.words.reset(text)
+
+    def get_buffer(self, tab):
+        return getattr(tab, 'buffer', None)
+
+    def start_paged_view(self, tab, paged):
+        tab.paged = paged
+        tab.view_first = 0
+        tab.view_lines = 0
+        tab.text_area.config(yscrollcommand=lambda *args: self.on_paged_scroll(tab))
+        threading.Thread(target=paged.build_index, daemon=True).start()
+        self.load_paged_window(tab, 0)
+        self.poll_paged_index(tab)
+
+    def close_paged_view(self, tab):
+        paged = getattr(tab, 'paged', None)
+        if paged is None:
+            return
+        paged.close()
+        tab.paged = None
+        text_area = self.get_text_widget(tab)
+        text_area.config(state=tk.NORMAL, yscrollcommand=lambda first, last: self.on_text_scroll(tab, first, last))
+        text_area.delete('1.0', tk.END)
+        if self.get_buffer(tab) is None:
+            self.attach_buffer(tab, text_area)
+        self.enable_undo(text_area)
+
+    def poll_paged_index(self, tab):
+        paged = getattr(tab, 'paged', None)
+        if paged is None or paged.cancelled:
+            return
+        # Refill a window that was cut short before its lines were indexed
+        if tab.view_first + tab.view_lines >= paged.line_count() - 1:
+            self.repage(tab)
+        else:
+            self.on_paged_scroll(tab)
+        if not paged.complete:
+            self.root.after(250, self.poll_paged_index, tab)
+
+    def visible_rows(self, text_area):
+        line_height = self.get_editor_font().metrics('linespace')
+        return max(1, text_area.winfo_height() // max(line_height, 1))
+
+    def load_paged_window(self, tab, line):
+        paged = tab.paged
+        text_area = tab.text_area
+        rows = self.visible_rows(text_area)
+        line = max(0, min(line, paged.line_count() - 1))
+        first, text = paged.read_lines(line - PAGED_VIEW_MARGIN, rows + 2 * PAGED_VIEW_MARGIN)
+        tab.view_first = first
+        tab.view_lines = text.count('\n') + 1
+
+        text_area.config(state=tk.NORMAL)
+        text_area.delete('1.0', tk.END)
+        text_area.insert('1.0', text)
+        text_area.config(state=tk.DISABLED)
+        text_area.yview(f"{line - first + 1}.0")
+
+        self.queue_line_numbers(tab)
+
+    def repage(self, tab):
+        if getattr(tab, 'paged', None) is None:
+            return
+        top = int(tab.text_area.index('@0,0').split('.')[0])
+        self.load_paged_window(tab, tab.view_first + top - 1)
+
+    def on_paged_scroll(self, tab):
+        paged = getattr(tab, 'paged', None)
+        if paged is None:
+            return
+        text_area = tab.text_area
+        top = int(text_area.index('@0,0').split('.')[0])
+        bottom = int(text_area.index(f'@0,{text_area.winfo_height()}').split('.')[0])
+
+        # The scrollbar reflects the position in the whole file, not the window
+        total = max(paged.estimated_line_count(), 1)
+        tab.v_scrollbar.set((tab.view_first + top - 1) / total, min(1.0, (tab.view_first + bottom) / total))
+        self.queue_line_numbers(tab)
+
+        near_top = top <= PAGED_VIEW_MARGIN // 2 and tab.view_first > 0
+        near_bottom = (tab.view_lines - bottom <= PAGED_VIEW_MARGIN // 2
+                       and tab.view_first + tab.view_lines < paged.line_count())
+        if near_top or near_bottom:
+            self.scheduler.schedule(f"repage:{tab}", self.repage, tab)
+
+    def start_grep(self, pattern_text, glob=None):
+        try:
+            pattern = compile_search(pattern_text, regex=True)
+            # The workers search bytes; a pattern that cannot be rewritten
+            # for them would otherwise just find nothing
+            compile_bytes_search(pattern, 'utf-8')
+        except re.error as e:
+            messagebox.showerror("Error", f"Invalid regular expression '{pattern_text}': {str(e)}")
+            return
+        except ValueError:
+            # Depends on the encoding of each file; the workers skip those files
+            pass
+
+        if self.grep_window is None or not self.grep_window.winfo_exists():
+            self.grep_window = tk.Toplevel(self.root)
+            self.grep_window.geometry("800x400")
+            self.grep_window.configure(bg=self.bg_color)
+            self.grep_window.columnconfigure(0, weight=1)
+            self.grep_window.rowconfigure(1, weight=1)
+
+            top_frame = tk.Frame(self.grep_window, bg=self.bg_color)
+            top_frame.grid(row=0, column=0, columnspan=2, sticky="ew", padx=5, pady=5)
+            self.grep_status = tk.Label(top_frame, text="", bg=self.bg_color, fg=self.fg_color, anchor="w")
+            self.grep_status.pack(side=tk.LEFT, fill=tk.X, expand=True)
+            tk.Button(top_frame, text="Cancel", command=self.cancel_grep).pack(side=tk.RIGHT)
+
+            self.grep_listbox = tk.Listbox(self.grep_window, bg=self.bg_color, fg=self.fg_color,
+                                           font=('Courier', 10), activestyle='none')
+            self.grep_listbox.grid(row=1, column=0, sticky="nsew")
+            grep_scrollbar = ttk.Scrollbar(self.grep_window, orient="vertical", command=self.grep_listbox.yview)
+            grep_scrollbar.grid(row=1, column=1, sticky="ns")
+            self.grep_listbox.config(yscrollcommand=grep_scrollbar.set)
+
+            self.grep_listbox.bind('<ButtonRelease-1>', self.open_grep_result)
+            self.grep_listbox.bind('<Return>', self.open_grep_result)
+            self.grep_window.bind('<Escape>', lambda e: self.cancel_grep())
+            self.grep_window.protocol("WM_DELETE_WINDOW", self.on_grep_close)
+        else:
+            self.grep_listbox.delete(0, tk.END)
+
+        where = f"{glob} in {self.current_dir}" if glob else self.current_dir
+        self.grep_window.title(f"Find in Files: {pattern_text}")
+        self.grep_status.config(text=f"Searching {where}...")
+        self.grep_results = []
+        self.grep_root = self.current_dir
+        self.grep_active = True
+        self.grep.start(self.current_dir, pattern, glob)
+        self.poll_grep(self.grep.generation)
+
+    def poll_grep(self, generation):
+        if generation != self.grep.generation or self.grep_window is None:
+            return
+        # Drain what the workers have sent for a bounded slice of time
+        deadline = time.monotonic() + STREAM_BATCH_SECONDS
+        rows = []
+        finished = False
+        while time.monotonic() < deadline:
+            try:
+                batch = self.grep.results.get_nowait()
+            except queue.Empty:
+                break
+            if batch is None:
+                finished = True
+                break
+            for path, line, preview in batch[:GREP_MAX_RESULTS - len(self.grep_results)]:
+                self.grep_results.append((path, line))
+                rows.append(f"{os.path.relpath(path, self.grep_root)}:{line}: {preview}")
+        if rows:
+            self.grep_listbox.insert(tk.END, *rows)
+
+        count = len(self.grep_results)
+        if count >= GREP_MAX_RESULTS:
+            self.grep_active = False
+            self.grep.cancel()
+            self.grep_status.config(text=f"Stopped after {count} matches.")
+        elif finished:
+            self.grep_active = False
+            self.grep_status.config(text=f"{count} matches in {self.grep.files} files.")
+            if self.grep.indexed_root is not None and not self.indexer.running:
+                # Pick up files changed since the index was built, for next time
+                self.indexer.update(self.grep.indexed_root)
+        else:
+            self.grep_status.config(text=f"Searching... {count} matches in {self.grep.files} files so far.")
+            self.root.after(50, self.poll_grep, generation)
+
+    def start_replace_in_files(self, command):
+        pattern_text, arrow, rest = command.partition(' ->')
+        if not arrow or rest[:1] not in ('', ' '):
+            messagebox.showerror("Error", "Invalid replace command. Use format: :replacein pattern -> replacement [glob]")
+            return
+        # Only the space after the arrow is dropped; the replacement may be empty.
+        # A trailing word with wildcards limits the files searched
+        replacement, glob = rest[1:], None
+        if ' ' in replacement and any(char in replacement.rsplit(' ', 1)[1] for char in '*?['):
+            replacement, glob = replacement.rsplit(' ', 1)
+        try:
+            pattern = compile_search(pattern_text.strip(), regex=True)
+        except re.error as e:
+            messagebox.showerror("Error", f"Invalid regular expression '{pattern_text.strip()}': {str(e)}")
+            return
+
+        if self.replace_files_window is None or not self.replace_files_window.winfo_exists():
+            self.replace_files_window = tk.Toplevel(self.root)
+            self.replace_files_window.geometry("800x400")
+            self.replace_files_window.configure(bg=self.bg_color)
+            self.replace_files_window.columnconfigure(0, weight=1)
+            self.replace_files_window.rowconfigure(1, weight=1)
+
+            top_frame = tk.Frame(self.replace_files_window, bg=self.bg_color)
+            top_frame.grid(row=0, column=0, columnspan=2, sticky="ew", padx=5, pady=5)
+            self.replace_files_status = tk.Label(top_frame, text="", bg=self.bg_color, fg=self.fg_color, anchor="w")
+            self.replace_files_status.pack(side=tk.LEFT, fill=tk.X, expand=True)
+            tk.Button(top_frame, text="Close", command=self.on_replace_files_close).pack(side=tk.RIGHT)
+            self.replace_files_apply = tk.Button(top_frame, text="Apply", command=self.apply_replace_in_files)
+            self.replace_files_apply.pack(side=tk.RIGHT, padx=5)
+
+            self.replace_files_listbox = tk.Listbox(self.replace_files_window, bg=self.bg_color, fg=self.fg_color,
+                                                    font=('Courier', 10), activestyle='none')
+            self.replace_files_listbox.grid(row=1, column=0, sticky="nsew")
+            scrollbar = ttk.Scrollbar(self.replace_files_window, orient="vertical",
+                                      command=self.replace_files_listbox.yview)
+            scrollbar.grid(row=1, column=1, sticky="ns")
+            self.replace_files_listbox.config(yscrollcommand=scrollbar.set)
+            self.replace_files_window.bind('<Escape>', lambda e: self.on_replace_files_close())
+            self.replace_files_window.protocol("WM_DELETE_WINDOW", self.on_replace_files_close)
+        else:
+            self.replace_files_listbox.delete(0, tk.END)
+
+        self.replace_files_window.title(f"Replace in Files: {pattern_text.strip()} -> {replacement}")
+        self.replace_files_apply.config(state=tk.DISABLED)
+        self.replace_files_status.config(text=f"Searching {glob + ' in ' if glob else ''}{self.current_dir}...")
+        self.replace_files_job = (pattern, replacement, self.current_dir)
+        self.replace_preview = []  # (path, count, mtime) per listed file
+        self.replace_search.start(self.current_dir, pattern, glob, count_file_matches)
+        self.poll_replace_preview(self.replace_search.generation)
+
+    def poll_replace_preview(self, generation):
+        if generation != self.replace_search.generation or self.replace_files_window is None:
+            return
+        root = self.replace_files_job[2]
+        deadline = time.monotonic() + STREAM_BATCH_SECONDS
+        rows = []
+        finished = False
+        while time.monotonic() < deadline:
+            try:
+                batch = self.replace_search.results.get_nowait()
+            except queue.Empty:
+                break
+            if batch is None:
+                finished = True
+                break
+            for path, count, mtime in batch:
+                self.replace_preview.append((path, count, mtime))
+                rows.append(f"{os.path.relpath(path, root)}  ({count})")
+        if rows:
+            self.replace_files_listbox.insert(tk.END, *rows)
+
+        total = sum(count for _, count, _ in self.replace_preview)
+        if not finished:
+            self.replace_files_status.config(text=f"Searching... {total} matches in {len(self.replace_preview)} files so far.")
+            self.root.after(50, self.poll_replace_preview, generation)
+        elif self.replace_preview:
+            self.replace_files_status.config(text=f"{total} matches in {len(self.replace_preview)} files. Apply to replace them all.")
+            self.replace_files_apply.config(state=tk.NORMAL)
+        else:
+            self.replace_files_status.config(text="No matches found.")
+
+    def apply_replace_in_files(self):
+        pattern, replacement, root = self.replace_files_job
+        self.replace_files_apply.config(state=tk.DISABLED)
+        # Files with unsaved edits in a tab are left alone rather than clobbered
+        futures = []
+        skipped = []
+        for path, count, mtime in self.replace_preview:
+            tab = self.tab_for_path(path)
+            if tab is not None and self.unsaved_changes.get(tab, False):
+                skipped.append(path)
+            else:
+                futures.append((path, self.worker_pool.submit(replace_in_file, path, pattern, replacement, mtime)))
+        self.poll_replace_apply(futures, skipped, root)
+
+    def poll_replace_apply(self, futures, skipped, root):
+        done = sum(1 for _, future in futures if future.done())
+        if done < len(futures):
+            if self.replace_files_window is not None:
+                self.replace_files_status.config(text=f"Applying... {done} of {len(futures)} files.")
+            self.root.after(100, self.poll_replace_apply, futures, skipped, root)
+            return
+
+        total = 0
+        changed = 0
+        failed = []
+        not_text = []
+        for path, future in futures:
+            try:
+                count = future.result()
+            except Exception as e:
+                failed.append(f"{os.path.relpath(path, root)}: {str(e)}")
+                continue
+            if count is None:
+                not_text.append(path)
+            elif count:
+                total += count
+                changed += 1
+                tab = self.tab_for_path(path)
+                if tab is not None:
+                    self.reload_tab(tab)
+
+        index = TrigramIndex.find(root)
+        if changed and index is not None and not self.indexer.running:
+            # Keep a trigram index over these files current for the next :grep
+            self.indexer.update(index[0])
+
+        summary = f"Replaced {total} occurrence(s) in {changed} file(s)."
+        if self.replace_files_window is not None:
+            self.replace_files_status.config(text=summary)
+        if skipped:
+            summary += "\n\nSkipped (unsaved changes in an open tab):\n" + "\n".join(os.path.relpath(path, root) for path in skipped)
+        if not_text:
+            summary += "\n\nSkipped (no longer a text file):\n" + "\n".join(os.path.relpath(path, root) for path in not_text)
+        if failed:
+            summary += "\n\nFailed:\n" + "\n".join(failed)
+            messagebox.showerror("Replace in Files", summary)
+        else:
+            messagebox.showinfo("Replace in Files", summary)
+
+    def on_replace_files_close(self):
+        self.replace_search.cancel()
+        self.replace_files_window.destroy()
+        self.replace_files_window = None
+
+    def tab_for_path(self, path):
+        for tab_id in self.notebook.tabs():
+            tab = self.notebook.nametowidget(tab_id)
+            tab_path = getattr(tab, 'file_path', None)
+            try:
+                if tab_path and os.path.samefile(tab_path, path):
+                    return tab
+            except OSError:
+                continue
+        return None
+
+    def reload_tab(self, tab):
+        # Bring a tab up to date with its file on disk
+        if getattr(tab, 'paged', None) is not None or getattr(tab, 'loader', None) is not None:
+            # Large files are reopened so the viewer or loader starts afresh
+            file_path = tab.file_path
+            read_only = getattr(tab, 'paged', None) is not None
+            self.notebook.select(tab)
+            self.close_current_tab()
+            self.open_file(file_path, read_only=read_only)
+            return
+        try:
+            with open(tab.file_path, 'r', encoding=getattr(tab, 'encoding', None)) as file:
+                content = file.read()
+        except (OSError, UnicodeDecodeError, LookupError) as e:
+            messagebox.showerror("Error", f"Failed to reload '{os.path.basename(tab.file_path)}': {str(e)}")
+            return
+        # Keep the cursor and scroll position where they were
+        text_area = tab.text_area
+        cursor = text_area.index(tk.INSERT)
+        top = text_area.yview()[0]
+        text_area.delete('1.0', tk.END)
+        text_area.insert('1.0', content)
+        text_area.edit_reset()
+        text_area.mark_set(tk.INSERT, cursor)
+        text_area.yview_moveto(top)
+        tab.disk_mtime = file_mtime(tab.file_path)
+        self.mark_changed_on_disk(tab, False)
+        self.unsaved_changes[tab] = False
+        self.update_tab_title(tab)
+
+    def start_index(self):
+        # Build or refresh the trigram index for current_dir in the background
+        self.indexer.update(self.current_dir)
+        self.poll_index(self.indexer.generation)
+
+    def poll_index(self, generation):
+        if generation != self.indexer.generation:
+            return
+        if self.indexer.running:
+            self.root.after(200, self.poll_index, generation)
+            return
+        root, files, read, error = self.indexer.result
+        if error is not None:
+            messagebox.showerror("Error", f"Failed to index '{root}': {str(error)}")
+        else:
+            messagebox.showinfo("Index", f"Indexed {files} files under '{root}' ({read} read).")
+
+    def cancel_grep(self):
+        if self.grep_active:
+            self.grep_active = False
+            self.grep.cancel()
+            self.grep_status.config(text=f"Cancelled after {len(self.grep_results)} matches.")
+
+    def on_grep_close(self):
+        self.grep.cancel()
+        self.grep_window.destroy()
+        self.grep_window = None
+
+    def open_grep_result(self, event=None):
+        selection = self.grep_listbox.curselection()
+        if not selection:
+            return
+        path, line = self.grep_results[selection[0]]
+        self.open_file(path, title=os.path.basename(path))
+        current_tab = self.notebook.nametowidget(self.notebook.select())
+        tab_path = getattr(current_tab, 'file_path', None)
+        if tab_path and os.path.exists(tab_path) and os.path.samefile(tab_path, path):
+            self.goto_loaded_line(current_tab, line)
+
+    def goto_loaded_line(self, tab, line):
+        # A file that is still streaming in may not have reached the line yet
+        if str(tab) not in self.notebook.tabs():
+            return
+        if getattr(tab, 'loader', None) is not None:
+            self.root.after(50, self.goto_loaded_line, tab, line)
+            return
+        self.notebook.select(tab)
+        self.goto_line(line)
+
+    def goto_line(self, line_number):
+        try:
+            line = int(line_number)
+        except ValueError:
+            messagebox.showerror("Error", "Invalid line number.")
+            return
+        current_tab = self.notebook.nametowidget(self.notebook.select())
+        text_area = self.get_text_widget(current_tab)
+        if text_area is None:
+            return
+
+        if getattr(current_tab, 'paged', None):
+            self.load_paged_window(current_tab, line - 1)
+            index = f"{line - current_tab.view_first}.0"
+        else:
+            index = f"{line}.0"
+        text_area.mark_set(tk.INSERT, index)
+        text_area.see(index)
+        text_area.focus_set()
 
     def on_scrollbar_y(self, *args):
         current_tab = self.notebook.nametowidget(self.notebook.select())
         text_area = self.get_text_widget(current_tab)
-        line_numbers = getattr(current_tab, 'line_numbers', None)
-        
-        if text_area and line_numbers:
-            text_area.yview_moveto(args[1])
-            line_numbers.yview_moveto(args[1])
+
+        paged = getattr(current_tab, 'paged', None)
+        if text_area and paged and args[0] == 'moveto':
+            # Jump straight to the matching line of the file
+            self.load_paged_window(current_tab, int(float(args[1]) * paged.estimated_line_count()))
+        elif text_area:
+            # The gutter follows through on_text_scroll
+            text_area.yview(*args)
+
+    def on_text_scroll(self, tab, first, last):
+        tab.v_scrollbar.set(first, last)
+        self.queue_line_numbers(tab)
+        if self.live_search is not None and self.live_search[0] is tab:
+            self.scheduler.schedule('search_view', self.highlight_visible_matches, tab)
 
     def on_text_change(self, event=None):
         current_tab = self.notebook.nametowidget(self.notebook.select())
         text_widget = self.get_text_widget(current_tab)
         if text_widget:
-            self.update_line_numbers()
+            if getattr(current_tab, 'paged', None) or getattr(current_tab, 'loader', None):
+                return
             if not self.unsaved_changes.get(current_tab, False):
                 self.unsaved_changes[current_tab] = True
                 self.update_tab_title(current_tab)
@@ -1070,32 +4713,56 @@ class TextEditor:
         elif not self.unsaved_changes.get(tab, False) and current_title.endswith('*'):
             self.notebook.tab(tab, text=current_title[:-1])
 
-    def update_line_numbers(self):
+    def get_editor_font(self):
+        if getattr(self, 'measure_font_key', None) != self.editor_font:
+            self.measure_font = tkfont.Font(root=self.root, font=self.editor_font)
+            self.measure_font_key = self.editor_font
+        return self.measure_font
+
+    def queue_line_numbers(self, tab):
+        # Scrolls, resizes and edits within one frame share a single redraw
+        self.scheduler.schedule(f"line_numbers:{tab}", self.update_line_numbers, tab)
+
+    def update_line_numbers(self, tab=None):
         if not self.line_numbers_enabled:
             return
-        
-        current_tab = self.notebook.nametowidget(self.notebook.select())
-        text_widget = self.get_text_widget(current_tab)
-        line_numbers = getattr(current_tab, 'line_numbers', None)
-        
-        if not text_widget or not line_numbers:
-            return
-
-        # Get the total number of lines in the text widget
-        total_lines = text_widget.get('1.0', tk.END).count('\n')
 
-        # Generate line numbers
-        line_numbers_text = '\n'.join(str(i) for i in range(1, total_lines + 1))
+        if tab is None:
+            tab = self.notebook.nametowidget(self.notebook.select())
+        text_widget = self.get_text_widget(tab)
+        line_numbers = getattr(tab, 'line_numbers', None)
 
-        # Update line numbers
-        line_numbers.config(state='normal', font=self.editor_font)
-        line_numbers.delete('1.0', tk.END)
-        line_numbers.insert('1.0', line_numbers_text)
-        line_numbers.config(state='disabled')
+        if not text_widget or not line_numbers:
+            return
 
-        # Update the width of line numbers widget based on the number of lines
-        width = len(str(total_lines))
-        line_numbers.config(width=width + 1)  # +1 for some padding
+        # Size the gutter for the largest line number in the file
+        buffer = self.get_buffer(tab)
+        paged = getattr(tab, 'paged', None)
+        offset = 0
+        if paged:
+            # The paged viewer shows a window, offset to its place in the file
+            offset = tab.view_first
+            total_lines = paged.estimated_line_count()
+        elif buffer:
+            total_lines = buffer.line_count()
+        else:
+            total_lines = int(text_widget.index('end-1c').split('.')[0])
+        font = self.get_editor_font()
+        width = font.measure('0' * len(str(total_lines))) + 8
+        if int(line_numbers.cget('width')) != width:
+            line_numbers.config(width=width)
+
+        # Draw numbers only for the lines currently on screen
+        line_numbers.delete('all')
+        line = int(text_widget.index('@0,0').split('.')[0])
+        last_line = int(text_widget.index('end-1c').split('.')[0])
+        while line <= last_line:
+            info = text_widget.dlineinfo(f"{line}.0")
+            if info is None:
+                break
+            line_numbers.create_text(width - 4, info[1], anchor='ne', text=str(line + offset),
+                                     fill='gray', font=self.editor_font)
+            line += 1
 
     def create_new_file(self, file_name):
         file_path = os.path.join(self.current_dir, file_name)
@@ -1119,58 +4786,114 @@ class TextEditor:
     def get_text_widget(self, tab):
         return getattr(tab, 'text_area', None)
 
-    def save_current_file(self):
+    def save_current_file(self, on_saved=None):
         current_tab = self.notebook.nametowidget(self.notebook.select())
         tab_name = self.notebook.tab(current_tab, "text")
         text_widget = self.get_text_widget(current_tab)
         if text_widget is None:
             messagebox.showerror("Error", "Cannot find text widget in the current tab.")
             return
-            
-        content = text_widget.get("1.0", tk.END)
+        if getattr(current_tab, 'paged', None):
+            messagebox.showerror("Error", "This file is open in the read-only paged viewer.")
+            return
+        if getattr(current_tab, 'loader', None):
+            messagebox.showerror("Error", "This file is still loading.")
+            return
 
         if tab_name.startswith("Untitled"):
             file_name = simpledialog.askstring("Save As", "Enter file name:")
             if file_name:
                 file_path = os.path.join(self.current_dir, file_name)
-                with open(file_path, 'w') as file:
-                    file.write(content)
-                self.update_dir_listing()
-                if self.notebook.index('end') > 1:
-                    self.notebook.forget(current_tab)
-                else:
-                    self.notebook.tab(current_tab, text=file_name)
-                    current_tab.file_path = file_path
-                self.unsaved_changes[current_tab] = False
-                self.update_tab_title(current_tab)
+                self.save_tab(current_tab, file_path, on_saved,
+                              lambda tab: self.finish_save_as(tab, file_name, file_path))
             else:
                 return
         else:
             file_path = getattr(current_tab, 'file_path', os.path.join(self.current_dir, tab_name.rstrip('*')))
-            with open(file_path, 'w') as file:
-                file.write(content)
-            self.update_dir_listing()
-            self.unsaved_changes[current_tab] = False
-            self.update_tab_title(current_tab)
+            self.save_tab(current_tab, file_path, on_saved)
+
+    def save_tab(self, tab, file_path, on_saved=None, on_written=None):
+        self.check_buffer(tab)
+        # Freeze the buffer now; the worker writes the frozen copy while
+        # editing carries on
+        snapshot = self.get_buffer(tab).snapshot()
+        tab.saving = True
+        write = functools.partial(atomic_write, file_path, snapshot.iter_chunks(), getattr(tab, 'encoding', None))
+        if self.workspace.covers(file_path):
+            future = self.save_executor.submit(self.workspace.track_save, os.path.abspath(file_path), write)
+        else:
+            future = self.save_executor.submit(write)
+        self.poll_save(tab, file_path, snapshot.version, future, on_saved, on_written)
+
+    def poll_save(self, tab, file_path, version, future, on_saved, on_written):
+        if not future.done():
+            self.root.after(50, self.poll_save, tab, file_path, version, future, on_saved, on_written)
+            return
+        tab.saving = False
+        try:
+            counts = future.result()
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to save '{os.path.basename(file_path)}': {str(e)}")
+            return
+        if counts is not None:
+            self.workspace.update_file(*counts)
+
+        if getattr(tab, 'file_path', None) == file_path:
+            tab.disk_mtime = file_mtime(file_path)
+            self.mark_changed_on_disk(tab, False)
+        self.update_dir_listing()
+        if on_written is not None:
+            on_written(tab)
+        # Only a save of the latest text clears the dirty marker
+        if tab in self.unsaved_changes and self.get_buffer(tab).version == version:
+            self.unsaved_changes[tab] = False
+            self.update_tab_title(tab)
+        if on_saved is not None:
+            on_saved(tab)
+
+    def finish_save_as(self, tab, file_name, file_path):
+        if self.notebook.index('end') > 1:
+            self.notebook.forget(tab)
+            self.unsaved_changes.pop(tab, None)
+        else:
+            self.notebook.tab(tab, text=file_name)
+            tab.file_path = file_path
+            tab.disk_mtime = file_mtime(file_path)
+        self.update_watches()
+
+    def close_tab(self, tab):
+        if str(tab) in self.notebook.tabs():
+            self.notebook.select(tab)
+            self.close_current_tab()
 
     def close_current_tab(self):
         current_tab = self.notebook.select()
+        # Closing a tab that is still loading cancels the load
+        self.stop_file_load(self.notebook.nametowidget(current_tab))
         if self.unsaved_changes.get(self.notebook.nametowidget(current_tab), False):
             if not messagebox.askyesno("Unsaved Changes", "There are unsaved changes. Do you want to close without saving?"):
                 return
         
         if self.notebook.index('end') > 1:
+            paged = getattr(self.notebook.nametowidget(current_tab), 'paged', None)
+            if paged is not None:
+                paged.close()
             self.notebook.forget(current_tab)
             del self.unsaved_changes[self.notebook.nametowidget(current_tab)]
         else:
             current_tab = self.notebook.nametowidget(current_tab)
+            self.close_paged_view(current_tab)
             text_widget = self.get_text_widget(current_tab)
             if text_widget is not None:
                 text_widget.delete('1.0', tk.END)
+                text_widget.edit_reset()
             self.notebook.tab(current_tab, text="Untitled-1")
             current_tab.file_path = None
+            current_tab.encoding = None
+            self.mark_changed_on_disk(current_tab, False)
             self.unsaved_changes[current_tab] = False
             self.update_tab_title(current_tab)
+        self.update_watches()
 
     def open_selected_file(self, event):
         selection = self.dir_listbox.curselection()
@@ -1178,36 +4901,119 @@ class TextEditor:
             item = self.dir_listbox.get(selection[0])
             self.navigate_or_open(item)
 
+    def queue_suggestions(self, event=None):
+        self.scheduler.schedule('suggestions', self.update_suggestions, delay=SUGGESTION_DEBOUNCE_MS)
+
     def update_suggestions(self, event=None):
         query = self.query_entry.get().strip()
         suggestions = []
 
-        if query.startswith(':copy ') or query.startswith(':move '):
+        if query.startswith(':o '):
+            self.start_file_suggestions(query[3:].strip())
+            return
+        elif query.startswith(':copy ') or query.startswith(':move '):
             parts = query.split()
             if len(parts) > 2 and parts[-2] == '->':
                 # We're dealing with a destination path
                 path = ' '.join(parts[3:])
-                suggestions = self.get_path_suggestions(path)
+                suggestions = list(itertools.islice(self.get_path_suggestions(path), 10))
             elif len(parts) == 2:
                 # We're dealing with a source path
-                suggestions = self.get_path_suggestions(parts[1])
+                suggestions = list(itertools.islice(self.get_path_suggestions(parts[1]), 10))
         elif query.startswith(':del ') or query.startswith(':info ') or query.startswith(':re '):
             parts = query.split()
             if len(parts) == 2:
                 # Suggest files and directories in the current directory
-                partial_name = parts[1].lower()
-                suggestions = [item for item in os.listdir(self.current_dir) 
-                               if item.lower().startswith(partial_name)]
-        else:
+                self.start_fuzzy_suggestions(parts[1])
+                return
+        elif not query.startswith(':'):
             # For all other cases, show suggestions from the current directory
-            all_items = ['..' if item == '..' else item for item in os.listdir(self.current_dir)]
-            suggestions = [item for item in all_items if item.lower().startswith(query.lower())]
+            self.start_fuzzy_suggestions(query)
+            return
+
+        self.scheduler.cancel('fuzzy')
+        self.show_suggestions(suggestions[:10])  # Limit to top 10 suggestions
 
+    def show_suggestions(self, suggestions):
         self.suggestion_listbox.delete(0, tk.END)
-        for suggestion in suggestions[:10]:  # Limit to top 10 suggestions
-            self.suggestion_listbox.insert(tk.END, suggestion)
+        self.suggestion_listbox.insert(tk.END, *suggestions)
+
+    def start_fuzzy_suggestions(self, query):
+        names = self.dir_cache.names(self.current_dir)
+        # The cached listing is replaced whenever the directory changes
+        source = self.dir_cache.listings.get(os.path.abspath(self.current_dir))
+        self.fuzzy.start(query, names, source)
+        self.scan_fuzzy_suggestions()
+
+    def file_list(self):
+        # The :o file list, crawling again if the root changed or the last
+        # crawl is getting old. May be None while the first crawl runs
+        root = os.path.abspath(self.open_root or self.current_dir)
+        crawler = self.crawler
+        if crawler.root != root or (not crawler.running
+                                    and time.monotonic() - crawler.crawled_at > FILE_LIST_REFRESH_SECONDS):
+            crawler.start(root)
+        return crawler.files
+
+    def start_file_suggestions(self, query):
+        files = self.file_list()
+        if files is None:
+            self.scheduler.cancel('fuzzy')
+            self.show_suggestions([])
+        else:
+            self.fuzzy.start(query, files.paths(), files)
+            self.scan_fuzzy_suggestions()
+        if self.crawler.running:
+            # Show the fresh list as soon as the crawl finishes
+            self.scheduler.schedule('file_list', self.poll_file_list, files, delay=200)
+
+    def poll_file_list(self, files):
+        if not self.query_entry.get().strip().startswith(':o '):
+            return
+        if self.crawler.files is not files:
+            self.update_suggestions()
+        elif self.crawler.running:
+            self.scheduler.schedule('file_list', self.poll_file_list, files, delay=200)
+
+    def open_anything(self, query):
+        files = self.file_list()
+        if files is None:
+            if self.crawler.error is not None:
+                messagebox.showerror("Error", f"Failed to list files: {str(self.crawler.error)}")
+            else:
+                messagebox.showerror("Error", f"Still collecting the files under '{self.crawler.root}'.")
+            return
+        # An exact relative path (from a suggestion) opens directly
+        if not os.path.isfile(os.path.join(files.root, query)):
+            self.fuzzy.start(query, files.paths(), files)
+            self.fuzzy.scan()
+            results = self.fuzzy.results()
+            if not results:
+                messagebox.showerror("Error", f"No file matches '{query}'.")
+                return
+            query = results[0]
+        self.open_file(os.path.join(files.root, query))
 
-    def get_path_suggestions(self, path):
+    def set_open_root(self, path):
+        if path is None:
+            self.open_root = None
+            return
+        path = os.path.abspath(os.path.join(self.current_dir, os.path.expanduser(path)))
+        if not os.path.isdir(path):
+            messagebox.showerror("Error", f"The directory '{path}' does not exist.")
+            return
+        self.open_root = path
+        self.file_list()
+
+    def scan_fuzzy_suggestions(self):
+        done = self.fuzzy.scan(time.monotonic() + FUZZY_FRAME_SECONDS)
+        self.show_suggestions(self.fuzzy.results())
+        if not done:
+            self.scheduler.schedule('fuzzy', self.scan_fuzzy_suggestions)
+
+    def path_matches(self, path):
+        # The directory a typed path points into, and the range of its
+        # sorted cached names that start with the last component
         if os.path.isabs(path):
             base_path = os.path.dirname(path)
             prefix = os.path.basename(path)
@@ -1216,52 +5022,72 @@ class TextEditor:
             prefix = os.path.basename(path)
 
         try:
-            items = os.listdir(base_path)
-        except FileNotFoundError:
-            return []
+            items = self.dir_cache.names(base_path)
+        except (FileNotFoundError, NotADirectoryError):
+            return base_path, [], 0, 0
+        start = bisect.bisect_left(items, prefix)
+        end = bisect.bisect_left(items, prefix + '\U0010ffff', start)
+        return base_path, items, start, end
 
-        suggestions = [os.path.join(base_path, item) for item in items if item.startswith(prefix)]
-        return suggestions
+    def get_path_suggestions(self, path):
+        # Joined lazily, so only the suggestions actually shown are built
+        base_path, items, start, end = self.path_matches(path)
+        return (os.path.join(base_path, items[i]) for i in range(start, end))
+
+    def get_path_completion(self, path):
+        # The names are sorted, so the first and last match share the prefix
+        # common to all of them
+        base_path, items, start, end = self.path_matches(path)
+        if start == end:
+            return None
+        return os.path.join(base_path, os.path.commonprefix([items[start], items[end - 1]]))
 
     def autofill_suggestion(self, event):
+        # Make sure the suggestion list reflects what has been typed so far
+        self.scheduler.flush('suggestions')
         query = self.query_entry.get().strip()
         if query.startswith(':copy ') or query.startswith(':move '):
             parts = query.split()
             if len(parts) > 2 and parts[-2] == '->':
                 # We're dealing with a destination path
                 path = ' '.join(parts[3:])
-                suggestions = self.get_path_suggestions(path)
-                if suggestions:
-                    common_prefix = os.path.commonprefix(suggestions)
-                    if common_prefix:
-                        new_query = ' '.join(parts[:3] + [common_prefix])
-                        self.query_entry.delete(0, tk.END)
-                        self.query_entry.insert(0, new_query)
+                common_prefix = self.get_path_completion(path)
+                if common_prefix:
+                    new_query = ' '.join(parts[:3] + [common_prefix])
+                    self.query_entry.delete(0, tk.END)
+                    self.query_entry.insert(0, new_query)
             elif len(parts) == 2:
                 # We're dealing with a source path
-                suggestions = self.get_path_suggestions(parts[1])
-                if suggestions:
-                    common_prefix = os.path.commonprefix(suggestions)
-                    if common_prefix:
-                        new_query = f"{parts[0]} {common_prefix}"
-                        self.query_entry.delete(0, tk.END)
-                        self.query_entry.insert(0, new_query)
+                common_prefix = self.get_path_completion(parts[1])
+                if common_prefix:
+                    new_query = f"{parts[0]} {common_prefix}"
+                    self.query_entry.delete(0, tk.END)
+                    self.query_entry.insert(0, new_query)
+        elif query.startswith(':o '):
+            self.fuzzy.scan()
+            suggestions = self.fuzzy.results() if self.fuzzy.source is self.crawler.files is not None else []
+            if suggestions:
+                self.query_entry.delete(0, tk.END)
+                self.query_entry.insert(0, f":o {suggestions[0]}")
         elif query.startswith(':del ') or query.startswith(':info ') or query.startswith(':re '):
             parts = query.split()
             if len(parts) == 2:
-                partial_name = parts[1].lower()
-                suggestions = [item for item in os.listdir(self.current_dir) 
-                               if item.lower().startswith(partial_name)]
+                # Finish the search so the best match is really the best
+                self.fuzzy.scan()
+                suggestions = self.fuzzy.results()
                 if suggestions:
-                    best_match = suggestions[0]  # Use the first match
+                    best_match = suggestions[0]  # Use the best match
                     new_query = f"{parts[0]} {best_match}"
                     self.query_entry.delete(0, tk.END)
                     self.query_entry.insert(0, new_query)
         else:
             # Handle other types of queries
-            suggestions = self.suggestion_listbox.get(0, tk.END)
+            suggestions = []
+            if not query.startswith(':'):
+                self.fuzzy.scan()
+                suggestions = self.fuzzy.results()
             if suggestions:
-                best_match = next((s for s in suggestions if s.lower().startswith(query.lower())), None)
+                best_match = suggestions[0]
                 if best_match:
                     self.query_entry.delete(0, tk.END)
                     self.query_entry.insert(0, best_match)
@@ -1274,6 +5100,8 @@ class TextEditor:
         selection = self.suggestion_listbox.curselection()
         if selection:
             suggestion = self.suggestion_listbox.get(selection[0])
+            if self.query_entry.get().strip().startswith(':o '):
+                suggestion = f":o {suggestion}"
             self.query_entry.delete(0, tk.END)
             self.query_entry.insert(0, suggestion)
             self.process_query()
@@ -1282,6 +5110,14 @@ def main():
     root = tk.Tk()
     editor = TextEditor(root)
     root.mainloop()
+    editor.workspace.generation += 1
+    editor.grep.cancel()
+    editor.replace_search.cancel()
+    editor.indexer.cancel()
+    editor.crawler.cancel()
+    editor.jobs.close()
+    editor.worker_pool.close()
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     main()